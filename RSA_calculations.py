@@ -1,12 +1,77 @@
-from typing import Tuple
+from array import array
+from collections import OrderedDict
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from multiprocessing import Pool
+from math import gcd, isqrt
+from os import cpu_count
+from random import Random, randrange
+from secrets import randbits
+from sys import byteorder, getsizeof
+from time import perf_counter
+from typing import (
+    Callable, Iterable, Iterator, NamedTuple, Sequence, Tuple, Union)
+
+from prime_sieve import SIEVE
+
+# NumPy is optional: without it, the batch Encode/Decode functions fall
+# back to one FME call per value.
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Set to True to check the arguments of FME on every call. The checks
+# are off by default because FME is the innermost hot path.
+DEBUG_CHECKS = False
+
+# Profiler collecting operation counts while instrumentation.profiling()
+# is active, or None when profiling is off.
+PROFILER = None
+
+def _count(name: str, k: int = 1) -> None:
+    """Add k to an operation counter of the active profiler, if any."""
+    if PROFILER is not None:
+        PROFILER.count(name, k)
+
+# Exponentiation backend used by FME: 'auto' (the built-in pow), 'python'
+# (the fastest pure Python backend for the operand size), or one of the
+# names in FME_BACKENDS.
+FME_BACKEND = 'auto'
 
 def FME(b: int, n: int, m: int) -> int:
     """Quickly compute b^n mod m for b, n, and m in the domain of 
     positive integers.
     """  
-    assert type(b) == int and b > 0, 'b must be a positive integer'
-    assert type(n) == int and n > 0, 'n must be a positive integer'
-    assert type(m) == int and m > 0, 'm must be a positive integer'
+    if DEBUG_CHECKS:
+        assert type(b) == int and b > 0, 'b must be a positive integer'
+        assert type(n) == int and n > 0, 'n must be a positive integer'
+        assert type(m) == int and m > 0, 'm must be a positive integer'
+
+    # The built-in pow is implemented in C (with its own sliding window
+    # for large exponents), so it is the fastest backend at every operand
+    # size and is used directly unless another backend is requested.
+    if FME_BACKEND == 'auto':
+        return pow(b, n, m)
+    if FME_BACKEND == 'python':
+        return FME_BACKENDS[select_FME_backend(n, m)](b, n, m)
+    return FME_BACKENDS[FME_BACKEND](b, n, m)
+
+def select_FME_backend(n: int, m: int) -> str:
+    """Choose the fastest pure Python exponentiation backend for exponent
+    n and modulus m.
+    """
+    # Precomputing a table of powers only pays off once the exponent is
+    # long enough to save more multiplications than the table costs.
+    # Montgomery multiplication replaces the division in each step with
+    # shifts and masks, but big-int division is already implemented in
+    # C, so it never beats the windowed method in pure Python.
+    if n.bit_length() <= 512:
+        return 'binary'
+    return 'window'
+
+def _FME_binary(b: int, n: int, m: int) -> int:
+    """Compute b^n mod m with the right-to-left binary method."""
 
     # Simultaneously get each binary bit for the exponent and accumulate
     # the values corresponing to those that are 1, performing mod m at 
@@ -21,65 +86,348 @@ def FME(b: int, n: int, m: int) -> int:
         n = n // 2
     return r
 
+def _window_size(bits: int) -> int:
+    """Choose the sliding window width for an exponent of the given bit
+    length.
+    """
+    for limit, width in ((8, 1), (24, 2), (80, 3), (240, 4), (672, 5)):
+        if bits <= limit:
+            return width
+    return 6
+
+def _window_recode(n: int, width: int) -> list:
+    """Split exponent n into sliding windows of at most width bits.
+    Return a list of (squarings, digit) steps: square the running result
+    that many times, then multiply it by b^digit (digit is odd, or 0 for
+    trailing zero bits).
+    """
+    bits = bin(n)[2:]
+    steps = []
+    zeros = 0
+    i = 0
+    while i < len(bits):
+        if bits[i] == '0':
+            zeros += 1
+            i += 1
+            continue
+
+        # Take the longest window of at most width bits that starts here
+        # and ends with a 1, so that its digit is odd.
+        j = min(i + width, len(bits))
+        while bits[j - 1] == '0':
+            j -= 1
+        steps.append((zeros + j - i, int(bits[i:j], 2)))
+        zeros = 0
+        i = j
+    if zeros:
+        steps.append((zeros, 0))
+    return steps
+
+def _FME_window(b: int, n: int, m: int, steps: list = None) -> int:
+    """Compute b^n mod m with the left-to-right sliding window method,
+    using precomputed odd powers of b.
+    The window steps for n can be passed in if they were precomputed.
+    """
+    if steps is None:
+        steps = _window_recode(n, _window_size(n.bit_length()))
+
+    # Precompute b^1, b^3, b^5, ... up to the largest digit needed.
+    b %= m
+    b2 = b * b % m
+    odd_powers = [b]
+    for _ in range(max(digit for _, digit in steps) // 2):
+        odd_powers.append(odd_powers[-1] * b2 % m)
+
+    r = 1
+    for squarings, digit in steps:
+        for _ in range(squarings):
+            r = r * r % m
+        if digit:
+            r = r * odd_powers[digit >> 1] % m
+    return r % m
+
+def _montgomery_constants(m: int) -> Tuple[int, int, int]:
+    """Return the constants (k, R - 1, m') for Montgomery multiplication
+    modulo the odd number m, where R = 2^k > m and m * m' = -1 (mod R).
+    """
+    k = m.bit_length()
+    mask = (1 << k) - 1
+    return k, mask, pow(-m, -1, 1 << k)
+
+def _FME_montgomery(
+        b: int, n: int, m: int,
+        constants: Tuple[int, int, int] = None) -> int:
+    """Compute b^n mod m with left-to-right binary exponentiation in
+    Montgomery form.
+    Montgomery reduction needs an odd modulus, so fall back to the
+    sliding window method for even m.
+    """
+    if m % 2 == 0:
+        return _FME_window(b, n, m)
+    if constants is None:
+        constants = _montgomery_constants(m)
+    k, mask, m_prime = constants
+
+    def reduce(t: int) -> int:
+        # Montgomery reduction: compute t / R (mod m) using only
+        # multiplications, masks, and shifts.
+        u = (t + ((t & mask) * m_prime & mask) * m) >> k
+        return u - m if u >= m else u
+
+    # Convert b and 1 into Montgomery form (x * R mod m), exponentiate,
+    # and convert the result back.
+    x = (b << k) % m
+    r = (1 << k) % m
+    for bit in bin(n)[2:]:
+        r = reduce(r * r)
+        if bit == '1':
+            r = reduce(r * x)
+    return reduce(r)
+
+FME_BACKENDS = {
+    'binary': _FME_binary,
+    'window': _FME_window,
+    'montgomery': _FME_montgomery,
+    'pow': pow,
+}
+
+def cross_check_FME(trials: int = 200) -> None:
+    """Check every exponentiation backend against the original binary
+    implementation on random operands of various sizes.
+    Raise an AssertionError describing the first mismatch.
+    """
+    for i in range(trials):
+        bits = (8, 23, 64, 256, 1024)[i % 5]
+        m = randbits(bits) | 1
+        n = randbits(bits) | 1
+        b = randrange(1, m) if m > 1 else 1
+        expected = _FME_binary(b, n, m)
+        for name, backend in FME_BACKENDS.items():
+            result = backend(b, n, m)
+            assert result == expected, (f'{name} backend gives {result} '
+                                        f'for {b}^{n} mod {m}, expected '
+                                        f'{expected}')
+
+# Operands whose smaller value has at least this many bits use Lehmer's
+# algorithm, which does most of Euclid's steps on the leading digits in
+# small integers; smaller operands use plain divmod steps. Below this
+# size a big integer divmod is cheap enough that the bookkeeping of
+# Lehmer's algorithm costs more than it saves: measured with EEA on
+# random operands of equal size, Lehmer's algorithm is about 6% slower
+# at 2048 bits, 8% faster at 2560 bits and 30% faster at 4096 bits.
+# (EEA(e, phi) in key generation has a 17-bit operand, so it always
+# takes divmod steps.)
+LEHMER_MIN_BITS = 2560
+
+# Number of leading bits of the operands simulated by each round of
+# Lehmer's algorithm: one CPython digit, so the simulated steps stay in
+# the fastest small integer arithmetic.
+LEHMER_DIGIT_BITS = 30
+
+# GCD backend used by Euclidean_Alg and EEA: 'auto' (math.gcd for
+# Euclidean_Alg, and the fastest pure Python backend for the operand
+# size for EEA), 'python' (the fastest pure Python backend for both), or
+# one of the names in GCD_BACKENDS. EEA chooses by operand size for a
+# backend that has no extended version.
+GCD_BACKEND = 'auto'
+
+def select_gcd_backend(b: int) -> str:
+    """Choose the fastest pure Python GCD backend when the smaller
+    operand is b.
+    """
+    if b.bit_length() >= LEHMER_MIN_BITS:
+        return 'lehmer'
+    return 'divmod'
+
+def _gcd_divmod(a: int, b: int) -> Tuple[int, int]:
+    """Return the GCD of a >= b > 0 and the number of Euclid's steps."""
+    steps = 0
+    while b:
+        a, b = b, a % b
+        steps += 1
+    return a, steps
+
+def _gcd_binary(a: int, b: int) -> Tuple[int, int]:
+    """Return the GCD of a >= b > 0 and the number of subtraction steps,
+    using Stein's binary GCD algorithm.
+    """
+    # Take out the power of 2 common to a and b, then every power of 2
+    # left in either of them can be dropped.
+    shift = ((a | b) & -(a | b)).bit_length() - 1
+    a >>= (a & -a).bit_length() - 1
+    steps = 0
+    while b:
+        b >>= (b & -b).bit_length() - 1
+        if a > b:
+            a, b = b, a
+        b -= a
+        steps += 1
+    return a << shift, steps
+
+def _lehmer_round(a: int, b: int) -> Tuple[int, int, int, int, int]:
+    """Simulate as many of Euclid's steps on a >= b as the leading
+    digits of a and b determine exactly (Knuth's Algorithm L).
+    Return the matrix (A, B, C, D) taking (a, b) to the values after
+    those steps, and the number of steps.
+    """
+    shift = a.bit_length() - LEHMER_DIGIT_BITS
+    x, y = a >> shift, b >> shift
+    A, B, C, D = 1, 0, 0, 1
+    steps = 0
+
+    # A quotient of the leading digits is only the true quotient if it
+    # is the same for both ends of the range the full values lie in.
+    while y + C and y + D:
+        q = (x + A) // (y + C)
+        if q != (x + B) // (y + D):
+            break
+        A, C = C, A - q * C
+        B, D = D, B - q * D
+        x, y = y, x - q * y
+        steps += 1
+    return A, B, C, D, steps
+
+def _gcd_lehmer(a: int, b: int) -> Tuple[int, int]:
+    """Return the GCD of a >= b > 0 and the number of Euclid's steps,
+    using Lehmer's algorithm.
+    """
+    steps = 0
+    while b.bit_length() > LEHMER_DIGIT_BITS:
+        A, B, C, D, k = _lehmer_round(a, b)
+        if B == 0:
+            # The leading digits did not determine even one quotient, so
+            # take one full step.
+            a, b = b, a % b
+            steps += 1
+        else:
+            a, b = A * a + B * b, C * a + D * b
+            steps += k
+    g, k = _gcd_divmod(a, b)
+    return g, steps + k
+
+def _EEA_divmod(a: int, b: int) -> Tuple[int, int, int, int]:
+    """Return the GCD of a >= b > 0, Bézout coefficients s and t with
+    s(a) + t(b) = GCD, and the number of Euclid's steps.
+    """
+    # Keep the invariants a = s1(a0) + t1(b0) and b = s2(a0) + t2(b0),
+    # with a0 and b0 the original values of a and b.
+    s1, t1 = 1, 0
+    s2, t2 = 0, 1
+    steps = 0
+    while b:
+        q, k = divmod(a, b)
+        a, b = b, k
+        s1, s2 = s2, s1 - q * s2
+        t1, t2 = t2, t1 - q * t2
+        steps += 1
+    return a, s1, t1, steps
+
+def _EEA_lehmer(a: int, b: int) -> Tuple[int, int, int, int]:
+    """Return the same values as _EEA_divmod using Lehmer's algorithm.
+    It takes exactly the same steps as Euclid's algorithm, so the Bézout
+    coefficients are the same too.
+    """
+    s1, t1 = 1, 0
+    s2, t2 = 0, 1
+    steps = 0
+    while b.bit_length() > LEHMER_DIGIT_BITS:
+        A, B, C, D, k = _lehmer_round(a, b)
+        if B == 0:
+            q, k = divmod(a, b)
+            a, b = b, k
+            s1, s2 = s2, s1 - q * s2
+            t1, t2 = t2, t1 - q * t2
+            steps += 1
+        else:
+            # Apply all of the simulated steps at once.
+            a, b = A * a + B * b, C * a + D * b
+            s1, s2 = A * s1 + B * s2, C * s1 + D * s2
+            t1, t2 = A * t1 + B * t2, C * t1 + D * t2
+            steps += k
+    g, s, t, k = _EEA_divmod(a, b)
+    return g, s * s1 + t * s2, s * t1 + t * t2, steps + k
+
+GCD_BACKENDS = {
+    'divmod': _gcd_divmod,
+    'binary': _gcd_binary,
+    'lehmer': _gcd_lehmer,
+}
+
+# Stein's algorithm does not take Euclid's steps, so it cannot give the
+# same Bézout coefficients and has no extended version here.
+EEA_BACKENDS = {
+    'divmod': _EEA_divmod,
+    'lehmer': _EEA_lehmer,
+}
+
+def cross_check_gcd(trials: int = 200) -> None:
+    """Check every GCD backend against the divmod implementation on
+    random operands of various sizes.
+    Raise an AssertionError describing the first mismatch.
+    """
+    for i in range(trials):
+        bits = (8, 64, 256, 1024, 4096)[i % 5]
+        b = randbits(bits) | 1
+        a = b + randbits(bits)
+        # Give some operands a large common factor.
+        if i % 3 == 0:
+            g = randbits(bits // 2) | 1
+            a, b = a * g, b * g
+        expected = _gcd_divmod(a, b)[0]
+        for name, backend in GCD_BACKENDS.items():
+            result = backend(a, b)[0]
+            assert result == expected, (f'{name} backend gives GCD '
+                                        f'{result} for {a}, {b}, expected '
+                                        f'{expected}')
+        expected = _EEA_divmod(a, b)
+        for name, backend in EEA_BACKENDS.items():
+            result = backend(a, b)
+            assert result == expected, (f'{name} backend gives {result} '
+                                        f'for EEA({a}, {b}), expected '
+                                        f'{expected}')
+
 def Euclidean_Alg(a: int, b: int) -> int:
     """Calculate the greatest common divisor of a and b."""
-    assert type(a) == int and a > 0, 'a must be a positive integer'
-    assert type(b) == int and b > 0, 'b must be a positive integer'
+    if DEBUG_CHECKS:
+        assert type(a) == int and a > 0, 'a must be a positive integer'
+        assert type(b) == int and b > 0, 'b must be a positive integer'
     
     # Make sure we do not try to perform the calculation with b greater
     # than a.
     if b > a:
         a, b = b, a
     
+    # math.gcd is implemented in C (with Lehmer's algorithm for large
+    # operands), so it is many times faster than any Python backend at
+    # every size. It does not report its steps, so they are not counted.
+    backend = GCD_BACKEND
+    if backend == 'auto':
+        return gcd(a, b)
+
     # As per Euclid's algorithm, GCD(a, b) = GCD(a mod b, b).
-    while b > 0:
-        k = a % b
-        a = b
-        b = k
-    
-    # When one of our mod operations results in a 0, the other number
-    # (a) is the GCD. 
-    x = a
+    if backend == 'python':
+        backend = select_gcd_backend(b)
+    x, steps = GCD_BACKENDS[backend](a, b)
+    _count('gcd_steps', steps)
     return x
 
 def EEA(a: int, b: int) -> Tuple[int, Tuple[int, int]]:
     """Compute the GCD and Bézout coefficients."""
-    assert type(a) == int and a > 0, 'a must be a positive integer'
-    assert type(b) == int and b > 0, 'b must be a positive integer'
+    if DEBUG_CHECKS:
+        assert type(a) == int and a > 0, 'a must be a positive integer'
+        assert type(b) == int and b > 0, 'b must be a positive integer'
 
     # Save the original values of a and b, then switch them if necessary
     # to assure that we do not calculate with b greater than a.
     a0, b0 = a, b
     if b0 > a0:
         a, b = b, a
-    
-    # Initialize the coefficients so that s1(a0) + t1(b0) = a and
-    # s2(a0) + t2(b0) = b for our initial values of a and b.
-    s1, t1 = 1, 0
-    s2, t2 = 0, 1
-    
-    while b > 0:
-        # Calculate the integer quotient q and the remainder k when 
-        # dividing a by b.
-        k = a % b
-        q = a // b
-        
-        # As per Euclid's algorithm, GCD(a, b) = GCD(a mod b, b).
-        a = b
-        b = k
-        
-        # Update the Bézout coefficients to maintain the loop invariants
-        # a = s1(a0) + t1(b0) and b = s2(a0) + t2(b0) for our new values
-        # of a and b.
-        # Use temporary "hat" variables because we need to use the
-        # previous values of s1, t1 when calculating the new values of
-        # s2, t2 AND vice versa.
-        s1hat, t1hat = s2, t2 
-        s2hat, t2hat = s1 - q * s2, t1 - q * t2
-        
-        # Assign the values of the temp variables to our non-temp 
-        # variables.
-        s1, t1, s2, t2 = s1hat, t1hat, s2hat, t2hat
+
+    backend = GCD_BACKEND
+    if backend not in EEA_BACKENDS:
+        backend = select_gcd_backend(b)
+    x, s1, t1, steps = EEA_BACKENDS[backend](a, b)
+    _count('gcd_steps', steps)
 
     # If we calculated with a and b flipped, flip the Bézout 
     # coefficients so they will be returned in the correct order with 
@@ -87,24 +435,336 @@ def EEA(a: int, b: int) -> Tuple[int, Tuple[int, int]]:
     if b0 > a0:
         s1, t1 = t1, s1
     
-    return a, (s1, t1) 
+    return x, (s1, t1) 
 
-def Find_Public_Key_e(p: int, q: int) -> Tuple[int, int]:
-    """Generate public key (n, e) from primes p and q."""
-    n = p * q
-    pm1qm1 = (p - 1) * (q - 1)
-    
-    # Iterate through all potential e values until we find one that is
-    # relatively prime to (p-1)(q-1) and not equal to p or q.
+def sieve_primes(limit: int) -> list:
+    """Return a list of all primes below limit from the persistent sieve
+    of Eratosthenes (see prime_sieve.py).
+    """
+    return list(SIEVE.primes(2, limit - 1))
+
+# The prime lists below are read from the sieve the first time they are
+# needed, so importing this module never touches the sieve file.
+
+@lru_cache(maxsize=None)
+def small_primes() -> list:
+    """Return the odd primes below 2000, used to cheaply reject most
+    composite candidates before running the comparatively expensive
+    Miller-Rabin test.
+    """
+    return sieve_primes(2000)[1:]
+
+@lru_cache(maxsize=None)
+def _window_primes() -> list:
+    """Return a longer list of odd primes for sieving whole windows of
+    candidates at once, where each extra prime costs one slice
+    assignment instead of one division per candidate.
+    """
+    return sieve_primes(1 << 16)[1:]
+
+# Supported range for the bit length of each generated prime.
+PRIME_BITS_MIN = 512
+PRIME_BITS_MAX = 4096
+
+# Preferred public exponent e used by key generation whenever it is valid
+# for the chosen primes.
+PUBLIC_EXPONENT = 65537
+
+# Miller-Rabin bases that give a deterministic answer for every n below
+# 3,317,044,064,679,887,385,961,981.
+_DETERMINISTIC_BASES = (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41)
+_DETERMINISTIC_LIMIT = 3317044064679887385961981
+
+def _miller_rabin_rounds(bits: int) -> int:
+    """Number of Miller-Rabin rounds needed for a random candidate of
+    the given bit length to have an error probability below 2^-100.
+    """
+    if bits >= 1536:
+        return 4
+    if bits >= 1024:
+        return 5
+    if bits >= 512:
+        return 8
+    return 40
+
+def is_probable_prime(n: int, rounds: int = 0) -> bool:
+    """Test whether n is prime using trial division by the small primes
+    followed by the Miller-Rabin test.
+    If rounds is 0, choose the number of rounds based on the size of n.
+    """
+    if n < 2:
+        return False
+    if n % 2 == 0:
+        return n == 2
+
+    # Numbers the sieve already covers are looked up directly.
+    if n < SIEVE.limit:
+        return SIEVE.is_prime(n)
+    primes = small_primes()
+    for p in primes:
+        if n % p == 0:
+            return n == p
+    if n < primes[-1] ** 2:
+        return True
+    return _miller_rabin(n, rounds)
+
+def _miller_rabin(n: int, rounds: int = 0) -> bool:
+    """Run the Miller-Rabin test on an odd n > 3 that has no small
+    factors.
+    """
+    # Write n - 1 as 2^s * r with r odd.
+    r = n - 1
+    s = 0
+    while r % 2 == 0:
+        r //= 2
+        s += 1
+
+    # Small n can be tested deterministically with a fixed set of bases.
+    # Otherwise use random bases.
+    if n < _DETERMINISTIC_LIMIT:
+        bases = _DETERMINISTIC_BASES
+    else:
+        if rounds <= 0:
+            rounds = _miller_rabin_rounds(n.bit_length())
+        bases = [randrange(2, n - 1) for _ in range(rounds)]
+
+    for a in bases:
+        x = pow(a, r, n)
+        if x == 1 or x == n - 1:
+            continue
+        for _ in range(s - 1):
+            x = x * x % n
+            if x == n - 1:
+                break
+        else:
+            # a is a witness to the compositeness of n.
+            return False
+    return True
+
+def _search_prime_window(bits: int, windows: int) -> int:
+    """Search up to the given number of random windows of odd candidates
+    of the given bit length for a prime.
+    Return the first prime found or 0 if there is none.
+    """
+    # About one in every ln(2^bits) / 2 odd numbers is prime, so a
+    # window of this size usually contains at least one.
+    size = max(64, bits)
+    for _ in range(windows):
+        # Set the top two bits so that the product of two such primes
+        # has exactly twice as many bits, and the bottom bit so that
+        # the starting candidate is odd.
+        start = randbits(bits) | (3 << (bits - 2)) | 1
+
+        # Sieve the window: candidate start + 2i is divisible by p
+        # exactly when i = -start / 2 (mod p).
+        composite = bytearray(size)
+        for p in _window_primes():
+            i = (-start * ((p + 1) // 2)) % p
+            composite[i::p] = b'\x01' * len(range(i, size, p))
+
+        for i in range(size):
+            if not composite[i]:
+                candidate = start + 2 * i
+                if (candidate.bit_length() == bits
+                        and _miller_rabin(candidate)):
+                    return candidate
+    return 0
+
+def _check_prime_bits(bits: int) -> None:
+    if not PRIME_BITS_MIN <= bits <= PRIME_BITS_MAX:
+        raise ValueError((f'bits must be between {PRIME_BITS_MIN} and '
+                          f'{PRIME_BITS_MAX}'))
+
+def _parallel_primes(bits: int, processes: int) -> Iterator[int]:
+    """Yield random primes with the given number of bits, found by a
+    single pool of worker processes that each search one window at a
+    time.
+    The pool is shut down without waiting for the windows still being
+    searched when the generator is closed.
+    """
+    pool = ProcessPoolExecutor(processes)
+    try:
+        pending = {pool.submit(_search_prime_window, bits, 1)
+                   for _ in range(processes)}
+        while True:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                # Keep every worker busy, so that a window searched while
+                # the caller was busy with the last prime is not wasted.
+                pending.add(pool.submit(_search_prime_window, bits, 1))
+                prime = future.result()
+                if prime:
+                    yield prime
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def generate_prime(bits: int, processes: int = 1) -> int:
+    """Generate a random prime with exactly the given number of bits
+    (between PRIME_BITS_MIN and PRIME_BITS_MAX).
+    If processes is greater than 1, split the search for candidates
+    across that many worker processes.
+    """
+    _check_prime_bits(bits)
+    if processes <= 1:
+        while True:
+            prime = _search_prime_window(bits, 1)
+            if prime:
+                return prime
+    primes = _parallel_primes(bits, processes)
+    try:
+        return next(primes)
+    finally:
+        primes.close()
+
+def generate_prime_pair(bits: int, processes: int = 1) -> Tuple[int, int]:
+    """Generate two distinct random primes p and q with the given number
+    of bits each, such that the preferred public exponent is valid for
+    them.
+    """
+    return generate_key_primes(bits, 2, processes)
+
+def generate_key_primes(
+        bits: int, count: int = 2, processes: int = 1) -> tuple:
+    """Generate count distinct random primes with the given number of
+    bits each, such that the preferred public exponent is valid for
+    them, for a key with that many primes.
+    All the primes of a key come from the same pool of worker processes
+    if processes is greater than 1.
+    """
+    _check_prime_bits(bits)
+    if processes <= 1:
+        return _take_key_primes(iter(lambda: generate_prime(bits), 0), count)
+    candidates = _parallel_primes(bits, processes)
+    try:
+        return _take_key_primes(candidates, count)
+    finally:
+        candidates.close()
+
+def _take_key_primes(candidates: Iterator[int], count: int) -> tuple:
+    """Take count distinct primes for a key from an iterator of random
+    primes, skipping those for which the preferred public exponent is
+    not valid.
+    """
+    primes = []
+    for p in candidates:
+        # p - 1 must be relatively prime to the public exponent.
+        if (p - 1) % PUBLIC_EXPONENT != 0 and p not in primes:
+            primes.append(p)
+            if len(primes) == count:
+                break
+    return tuple(primes)
+
+def keygen_throughput(
+        bits: int = 1024, count: int = 5, processes: int = 1) -> float:
+    """Generate count full key pairs from primes with the given number
+    of bits and return the throughput in keys per second.
+    If processes is greater than 1, one pool of that many worker
+    processes finds the primes for every key.
+    """
+    _check_prime_bits(bits)
+    start = perf_counter()
+    if processes <= 1:
+        candidates = iter(lambda: generate_prime(bits), 0)
+    else:
+        candidates = _parallel_primes(bits, processes)
+    try:
+        for _ in range(count):
+            p, q = _take_key_primes(candidates, 2)
+            n, e = Find_Public_Key_e(p, q)
+            Find_Private_Key_d(e, p, q)
+    finally:
+        if processes > 1:
+            candidates.close()
+    return count / (perf_counter() - start)
+
+def _prime_pair_task(task: Tuple[int, int]) -> Tuple[int, int]:
+    """Generate a pair of primes with the given number of bits for which
+    public exponent e is valid, in a bulk_keygen worker process.
+    """
+    bits, e = task
+    while True:
+        p, q = generate_prime_pair(bits)
+        if e == PUBLIC_EXPONENT or Find_Public_Key_e(p, q, e=e)[1] == e:
+            return p, q
+
+def bulk_keygen(
+        count: int, bits: int = 1024, processes: int = 0,
+        batch_size: int = 256, e: int = PUBLIC_EXPONENT
+        ) -> Iterator[Tuple[int, int, int, int, int]]:
+    """Generate count key pairs from primes with the given number of bits
+    each, yielding each key as (n, e, d, p, q) as soon as its batch is
+    done.
+    The prime pairs are generated by a pool of worker processes (one per
+    CPU if processes is 0), and the private exponents of each batch are
+    computed with a single modular inversion.
+    """
+    if processes <= 0:
+        processes = cpu_count() or 1
+    tasks = [(bits, e)] * count
+
+    def finish(pairs: list) -> Iterator[Tuple[int, int, int, int, int]]:
+        ds = Batch_Private_Keys_d(e, [(p - 1) * (q - 1) for p, q in pairs])
+        for (p, q), d in zip(pairs, ds):
+            yield p * q, e, d, p, q
+
+    if processes == 1:
+        pairs = map(_prime_pair_task, tasks)
+        pool = None
+    else:
+        pool = Pool(processes)
+        pairs = pool.imap_unordered(_prime_pair_task, tasks)
+    try:
+        batch = []
+        for pair in pairs:
+            batch.append(pair)
+            if len(batch) == batch_size:
+                yield from finish(batch)
+                batch = []
+        if batch:
+            yield from finish(batch)
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+def Find_Public_Key_e(
+        p: int, q: int, *more_primes: int,
+        e: int = PUBLIC_EXPONENT) -> Tuple[int, int]:
+    """Generate public key (n, e) from primes p and q, and any more
+    primes for a multi-prime key.
+    Use the preferred public exponent e (65537 by default) whenever it
+    is valid for the primes, and only search for another one otherwise.
+    """
+    primes = (p, q) + more_primes
+    n = 1
+    pm1qm1 = 1
+    for r in primes:
+        n *= r
+        pm1qm1 *= r - 1
+
+    # The preferred exponent works as long as it is relatively prime to
+    # (p-1)(q-1), smaller than it, and not one of the primes, which makes
+    # key generation a fixed amount of work for almost all primes. (With
+    # more primes, (p-1)(q-1) here stands for the product of every
+    # prime minus 1.)
+    if 1 < e < pm1qm1 and e not in primes and gcd(pm1qm1, e) == 1:
+        return n, e
+
+    # Otherwise iterate through the potential e values until we find one
+    # that is relatively prime to (p-1)(q-1) and not one of the primes.
+    # The candidates are all known to be positive integers, so use the
+    # built-in gcd directly instead of the validating Euclidean_Alg.
     for i in range(2, pm1qm1):
-        if i != p and i != q and Euclidean_Alg(pm1qm1, i) == 1:
-            e = i
-            break 
-    return n, e
+        if i not in primes and gcd(pm1qm1, i) == 1:
+            return n, i
+    raise ValueError('the primes do not admit a valid public exponent')
 
-def Find_Private_Key_d(e: int, p: int, q: int) -> int:
-    """Generate private key d from public key e and primes p and q."""
+def Find_Private_Key_d(e: int, p: int, q: int, *more_primes: int) -> int:
+    """Generate private key d from public key e and primes p and q, and
+    any more primes for a multi-prime key.
+    """
     pm1qm1 = (p - 1) * (q - 1)
+    for r in more_primes:
+        pm1qm1 *= r - 1
     
     # It follows from Bézout's Theorem that if sa + tb = 1, then s is an
     # inverse of a (mod b).
@@ -118,71 +778,963 @@ def Find_Private_Key_d(e: int, p: int, q: int) -> int:
         d += pm1qm1
     return d
 
-def Convert_Text(_string: str) -> list:
-    """Convert a string of text into a list of the ASCII integers 
-    corresponding to each character.
+def Batch_Private_Keys_d(e: int, pm1qm1s: list) -> list:
+    """Generate the private key d for public key e and each of the given
+    values of (p-1)(q-1), with a single modular inversion for the whole
+    batch.
+    Return the same d values that Find_Private_Key_d would.
+    """
+    # d = e^-1 (mod (p-1)(q-1)) is the integer (1 + (p-1)(q-1)t) / e where
+    # t = -((p-1)(q-1))^-1 (mod e), so every inversion is modulo the same
+    # number e. Montgomery's trick then inverts the product of all of
+    # them once and recovers each inverse with two multiplications.
+    residues = []
+    prefixes = []
+    product = 1
+    for pm1qm1 in pm1qm1s:
+        r = pm1qm1 % e
+        residues.append(r)
+        prefixes.append(product)
+        product = product * r % e
+    divisor, (inverse, t) = EEA(product, e) if product else (e, (0, 0))
+    if divisor != 1:
+        raise ValueError('e must be relatively prime to every (p-1)(q-1)')
+    inverse %= e
+
+    # Walk back through the batch: the inverse of the product of the
+    # first i + 1 residues times the product of the first i gives the
+    # inverse of residue i.
+    ds = [0] * len(residues)
+    for i in range(len(residues) - 1, -1, -1):
+        t = -(inverse * prefixes[i]) % e
+        ds[i] = (1 + pm1qm1s[i] * t) // e
+        inverse = inverse * residues[i] % e
+    return ds
+
+class PrivateKey(NamedTuple):
+    """Private key (n, d) together with the primes p and q and the
+    precomputed values needed to decode with the Chinese Remainder
+    Theorem: dP = d mod (p-1), dQ = d mod (q-1), and qInv = q^-1 mod p.
+    A multi-prime key also has a triple (r, dR, tR) in others for each
+    prime r beyond p and q, where dR = d mod (r-1) and tR is the inverse
+    (mod r) of the product of all the primes before r.
     """
-    integer_list = []
-    for ch in _string:
-        integer_list.append(ord(ch))
-    return integer_list
+    n: int
+    d: int
+    p: int
+    q: int
+    dP: int
+    dQ: int
+    qInv: int
+    others: tuple = ()
 
-def Convert_Num(_list: list) -> str:
-    """Convert a list of ASCII values into a string of their 
-    corresponding characters.
+def Build_Private_Key(
+        d: int, p: int, q: int, *more_primes: int) -> PrivateKey:
+    """Build a private key object from private key d and primes p and q,
+    and any more primes for a multi-prime key.
     """
-    _string = ''
-    for i in _list:
-        _string += chr(i)
-    return _string
+    # The inverse of q (mod p) is its Bézout coefficient, adjusted to be
+    # positive.
+    gcd, (s, t) = EEA(q, p)
+    qInv = s % p
 
-def Encode(n: int, e: int, message: str) -> list:
-    """Encode a message into numeric cipher text."""
-    msg_nums = Convert_Text(message)
-    cipher_text = []
+    # Each further prime needs the inverse of the product of the primes
+    # before it, as in the multi-prime keys of PKCS #1.
+    n = p * q
+    others = []
+    for r in more_primes:
+        gcd, (s, t) = EEA(n % r, r)
+        others.append((r, d % (r - 1), s % r))
+        n *= r
+    return PrivateKey(
+        n, d, p, q, d % (p - 1), d % (q - 1), qInv, tuple(others))
+
+def _CRT_FME(b: int, n: int, m: int) -> int:
+    """Compute b^n mod m for one of the CRT halves, where b and n may be
+    0 after being reduced by the prime modulus m or by m - 1.
+    """
+    b %= m
+    if b == 0:
+        return 0
+    if n == 0:
+        return 1
+    return FME(b, n, m)
+
+def CRT_Decode(C: int, key: PrivateKey) -> int:
+    """Compute C^d mod n with two half-size exponentiations (mod p and
+    mod q) recombined with the Chinese Remainder Theorem, or one
+    exponentiation per prime for a multi-prime key.
+    """
+    # By Fermat's Little Theorem, C^d = C^(d mod (p-1)) (mod p) and
+    # likewise for q, so each half only needs a reduced exponent.
+    m1 = _CRT_FME(C, key.dP, key.p)
+    m2 = _CRT_FME(C, key.dQ, key.q)
+
+    # Garner's formula gives the unique M (mod n) that is congruent to
+    # m1 (mod p) and m2 (mod q).
+    h = key.qInv * (m1 - m2) % key.p
+    M = m2 + h * key.q
+
+    # Fold in each further prime the same way, extending M from a
+    # residue modulo the product of the primes so far.
+    R = key.p * key.q
+    for r, dR, tR in key.others:
+        mR = _CRT_FME(C, dR, r)
+        M += R * ((mR - M) * tR % r)
+        R *= r
+    return M
+
+# Code points are kept in arrays of 4-byte unsigned integers, whose
+# memory is exactly the text encoded as UTF-32 in the machine's byte
+# order, so converting between the two is a single codec call.
+CODE_POINT_TYPE = 'I' if array('I').itemsize == 4 else 'L'
+_UTF32 = 'utf-32-le' if byteorder == 'little' else 'utf-32-be'
+
+# Numeric cipher text for moduli up to this limit is kept in arrays of
+# 8-byte unsigned integers instead of lists of int objects.
+CIPHER_ARRAY_MAX_N = 1 << 64
+
+def Convert_Text(text: Union[str, bytes]) -> array:
+    """Convert text (a string, or UTF-8 bytes, bytearray, or memoryview)
+    into an array of the Unicode code points of its characters.
+    """
+    if not isinstance(text, str):
+        text = str(text, 'utf-8')
+    code_points = array(CODE_POINT_TYPE)
+    code_points.frombytes(text.encode(_UTF32, 'surrogatepass'))
+    return code_points
+
+def Convert_Num(code_points: Iterable[int]) -> str:
+    """Convert code points (an array, or any iterable of integers) into
+    the string of their corresponding characters.
+    """
+    if not (isinstance(code_points, array)
+            and code_points.typecode == CODE_POINT_TYPE):
+        try:
+            code_points = array(CODE_POINT_TYPE, code_points)
+        except OverflowError:
+            raise ValueError('code point out of range') from None
+    return code_points.tobytes().decode(_UTF32, 'surrogatepass')
+
+def _cipher_buffer(n: int, values: Iterable[int]) -> Sequence[int]:
+    """Collect numbers below n into an array if they fit in one, and into
+    a list otherwise.
+    """
+    if n <= CIPHER_ARRAY_MAX_N:
+        return array('Q', values)
+    return list(values)
+
+def Block_Size(n: int) -> int:
+    """Return the number of bytes that can be packed into each plaintext
+    block so that every block is guaranteed to be less than n.
+    """
+    return (n.bit_length() - 1) // 8
+
+def Pack_Blocks(data: bytes, width: int) -> list:
+    """Pack bytes into a list of integers of width bytes each.
+    The data is padded by appending a single 0x80 byte followed by as
+    many 0x00 bytes as needed to fill the last block (ISO/IEC 7816-4
+    padding), so its exact length can be recovered when unpacking.
+    """
+    padded = bytearray(data)
+    padded += b'\x80' + bytes(-(len(padded) + 1) % width)
+    view = memoryview(padded)
+    blocks = []
+    for i in range(0, len(padded), width):
+        blocks.append(int.from_bytes(view[i:i + width], 'big'))
+    return blocks
+
+def Unpack_Blocks(blocks: list, width: int) -> bytes:
+    """Unpack a list of integers of width bytes each into the bytes that
+    were packed by Pack_Blocks, removing the padding.
+    """
+    try:
+        padded = b''.join(M.to_bytes(width, 'big') for M in blocks)
+    except OverflowError:
+        raise ValueError('block does not fit in the block width') from None
+
+    # Remove the trailing 0x00 bytes and then the 0x80 marker byte.
+    data = padded.rstrip(b'\x00')
+    if not data.endswith(b'\x80'):
+        raise ValueError('invalid block padding')
+    return data[:-1]
+
+class CodebookCache:
+    """Bounded LRU cache of per-key codebooks for per-character Encode
+    and Decode with small moduli.
+    Each key (n, exponent) has a lazily filled table mapping x to
+    x^exponent mod n and the inverse table mapping the results back to
+    x. When the total number of entries exceeds max_entries, whole keys
+    are evicted starting with the least recently used one.
+    """
+
+    def __init__(self, max_entries: int = 1 << 20) -> None:
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._books = OrderedDict()
+        self._entries = 0
+
+    def tables(self, n: int, exponent: int) -> Tuple[dict, dict]:
+        """Return the (forward, inverse) tables for the key (n, exponent),
+        creating empty ones if necessary.
+        """
+        key = (n, exponent)
+        book = self._books.get(key)
+        if book is None:
+            book = self._books[key] = ({}, {})
+        else:
+            self._books.move_to_end(key)
+        return book
+
+    def power_all(
+            self, n: int, exponent: int, values: Sequence[int],
+            compute: Callable[[int], int], typecode: str = 'Q') -> array:
+        """Return an array (of the given type) of x^exponent mod n for
+        every x in values, looking each one up in the codebook for
+        (n, exponent) and calling compute(x) only for the ones that are
+        not in it yet.
+        """
+        forward, inverse = self.tables(n, exponent)
+        before = len(forward)
+
+        # Only the distinct new values are computed, and the results are
+        # then filled in with one lookup per value.
+        for x in set(values).difference(forward):
+            y = forward[x] = compute(x)
+            inverse[y] = x
+        results = array(typecode, map(forward.__getitem__, values))
+
+        # Update the statistics once per call instead of once per value.
+        added = len(forward) - before
+        self.misses += added
+        self.hits += len(results) - added
+        self._entries += added
+        self._evict((n, exponent))
+        return results
+
+    def store(self, n: int, exponent: int, pairs: dict) -> None:
+        """Add already computed pairs x: x^exponent mod n to the codebook
+        for (n, exponent), unless that would take the cache over its size
+        limit (nothing is evicted to make room).
+        """
+        if not pairs or self._entries + len(pairs) > self.max_entries:
+            return
+        forward, inverse = self.tables(n, exponent)
+        before = len(forward)
+        forward.update(pairs)
+        for x, y in pairs.items():
+            inverse[y] = x
+        self._entries += len(forward) - before
+
+    def _evict(self, current: tuple) -> None:
+        """Evict least recently used keys other than the current one until
+        the cache is within its size limit.
+        """
+        while self._entries > self.max_entries and len(self._books) > 1:
+            key, (forward, inverse) = self._books.popitem(last=False)
+            if key == current:
+                # The current key was just used, so it goes back to the
+                # most recently used end.
+                self._books[key] = (forward, inverse)
+                continue
+            self._entries -= len(forward)
+            self.evictions += 1
+
+        # A single key that exceeds the limit on its own starts over.
+        if self._entries > self.max_entries:
+            self.clear()
+
+    def clear(self) -> None:
+        """Remove every codebook from the cache."""
+        self._books.clear()
+        self._entries = 0
+
+    def stats(self) -> dict:
+        """Return the hit rate, size, and approximate memory use (in bytes)
+        of the cache.
+        """
+        lookups = self.hits + self.misses
+        memory = getsizeof(self._books)
+        for forward, inverse in self._books.values():
+            memory += getsizeof(forward) + getsizeof(inverse)
+            for x, y in forward.items():
+                memory += getsizeof(x) + getsizeof(y)
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'keys': len(self._books),
+            'entries': self._entries,
+            'memory_bytes': memory,
+            }
+
+# Per-character Encode and Decode use the codebook cache for moduli below
+# this limit, where the number of distinct characters in messages is
+# small compared to the number of possible values.
+CODEBOOK_MAX_N = 1 << 32
+CODEBOOK = CodebookCache()
+
+def Encode(
+        n: int, e: int, message: Union[str, bytes],
+        block: bool = False) -> Sequence[int]:
+    """Encode a message (a string, or UTF-8 bytes, bytearray, or
+    memoryview) into numeric cipher text, returned as an array of
+    integers if n is at most 2^64 and as a list otherwise.
+    By default each character is encoded separately. In block mode, the
+    UTF-8 bytes of the message are packed into as few integers less
+    than n as possible, so it takes far fewer exponentiations.
+    """
+    if block:
+        width = Block_Size(n)
+        if width < 1:
+            raise ValueError('n is too small for block mode')
+        if isinstance(message, str):
+            message = message.encode('utf-8')
+        msg_nums = Pack_Blocks(message, width)
+    else:
+        msg_nums = Convert_Text(message)
+        if n < CODEBOOK_MAX_N:
+            # Repeated characters are looked up instead of recomputed.
+            return CODEBOOK.power_all(
+                n, e, msg_nums, lambda M: FME(M, e, n) if M else 0)
     
     # Due to Fermat's Little Theorem and the Chinese Remainder Theorem,
     # we get the cipher from the message using C = M^e mod n.
-    for M in msg_nums:
-        cipher_text.append(FME(M, e, n))
-    return cipher_text
+    # (Blocks can be 0, which FME does not accept, but 0^e = 0.)
+    return _cipher_buffer(n, (FME(M, e, n) if M else 0 for M in msg_nums))
 
-def Decode(n: int, d: int, cipher_text: list) -> str:
-    """Decode a message from its numeric cipher text."""
+def Decode(
+        n: int, d: int, cipher_text: Sequence[int], key: PrivateKey = None,
+        block: bool = False) -> str:
+    """Decode a message from its numeric cipher text (an array or list of
+    integers).
+    If a private key object for n is provided, use the faster Chinese
+    Remainder Theorem path. Use block mode if the message was encoded in
+    block mode.
+    """
 
     # Due to Fermat's Little Theorem and the Chinese Remainder Theorem,
     # we get the message from the cipher using M = C^d mod n.
-    msg_nums = []
+    if block:
+        msg_nums = _decode_nums(n, d, cipher_text, key)
+        return Unpack_Blocks(msg_nums, Block_Size(n)).decode('utf-8')
+    if n < CODEBOOK_MAX_N:
+        # Repeated ciphers are looked up instead of recomputed, straight
+        # into an array of code points (which n is small enough to fit).
+        msg_nums = CODEBOOK.power_all(
+            n, d, cipher_text, lambda C: FME(C, d, n) if C else 0,
+            CODE_POINT_TYPE)
+    else:
+        msg_nums = _decode_iter(n, d, cipher_text, key)
+    return Convert_Num(msg_nums)
+
+# Moduli below this limit keep every product of two residues below 2^64,
+# so the batch functions can square and multiply whole uint64 arrays at
+# once without overflow.
+BATCH_MAX_N = 1 << 32
+
+def Encode_Array(n: int, e: int, code_points):
+    """Encode an array of code points (one per character) into an array
+    of ciphers, using vectorized NumPy arithmetic when n is small enough
+    and a list built with FME otherwise.
+    """
+    return _power_array(code_points, e, n)
+
+def Decode_Array(n: int, d: int, cipher_text):
+    """Decode an array of ciphers into an array of code points, using
+    vectorized NumPy arithmetic when n is small enough and a list built
+    with FME otherwise.
+    """
+    return _power_array(cipher_text, d, n)
+
+def _power_array(values, exponent: int, n: int):
+    """Compute x^exponent mod n for every x in values."""
+    if np is None or n >= BATCH_MAX_N:
+        results = []
+        for x in values:
+            results.append(FME(x, exponent, n) if x else 0)
+        return results
+
+    # The same right-to-left binary method as FME, applied to every
+    # element of the array at each step.
+    m = np.uint64(n)
+    b = np.asarray(values, dtype=np.uint64) % m
+    r = np.ones_like(b) % m
+    while exponent > 0:
+        if exponent % 2 == 1:
+            r = r * b % m
+        b = b * b % m
+        exponent = exponent // 2
+    return r
+
+def Encode_Stream(
+        n: int, e: int, chunks: Iterable,
+        block: bool = False) -> Iterator[int]:
+    """Encode a message that arrives in chunks, yielding the numeric
+    cipher text as it goes so that memory use does not depend on the
+    length of the message.
+    The chunks are strings, or bytes in block mode, and the result is the
+    same as encoding the whole message at once.
+    """
+    if not block:
+        for chunk in chunks:
+            yield from Encode(n, e, chunk)
+        return
+
+    width = Block_Size(n)
+    if width < 1:
+        raise ValueError('n is too small for block mode')
+
+    # Encode every complete block right away and carry the leftover bytes
+    # over to the next chunk. Only the last block gets padded.
+    leftover = b''
+    for chunk in chunks:
+        data = leftover + chunk
+        end = len(data) - len(data) % width
+        for i in range(0, end, width):
+            M = int.from_bytes(data[i:i + width], 'big')
+            yield FME(M, e, n) if M else 0
+        leftover = data[end:]
+    for M in Pack_Blocks(leftover, width):
+        yield FME(M, e, n) if M else 0
+
+def Decode_Stream(
+        n: int, d: int, cipher_text: Iterable[int], key: PrivateKey = None,
+        block: bool = False, batch_size: int = 4096) -> Iterator:
+    """Decode numeric cipher text that arrives as a stream of integers,
+    yielding the message in chunks (strings, or bytes in block mode) of
+    at most batch_size characters or blocks.
+    """
+    width = Block_Size(n)
+    pending = None
+    batch = []
     for C in cipher_text:
-        msg_nums.append(FME(C, d, n))
-    message = ''
-    message = Convert_Num(msg_nums)
-    return message
+        batch.append(C)
+        if len(batch) < batch_size:
+            continue
+        if not block:
+            yield Decode(n, d, batch, key)
+        else:
+            # Hold back the last block of each batch, since only the very
+            # last block of the message contains padding.
+            msg_nums = _decode_nums(n, d, batch, key)
+            if pending is not None:
+                msg_nums.insert(0, pending)
+            pending = msg_nums.pop()
+            yield b''.join(M.to_bytes(width, 'big') for M in msg_nums)
+        batch = []
+
+    if not block:
+        if batch:
+            yield Decode(n, d, batch, key)
+        return
+    msg_nums = _decode_nums(n, d, batch, key)
+    if pending is not None:
+        msg_nums.insert(0, pending)
+    if not msg_nums:
+        raise ValueError('block mode cipher text must not be empty')
+    yield Unpack_Blocks(msg_nums, width)
+
+def _decode_iter(
+        n: int, d: int, cipher_text: Iterable[int],
+        key: PrivateKey = None) -> Iterator[int]:
+    """Yield C^d mod n for every cipher C, using the Chinese Remainder
+    Theorem if a private key object for n is provided.
+    """
+    if key is not None and key.n == n:
+        for C in cipher_text:
+            yield CRT_Decode(C, key)
+    else:
+        for C in cipher_text:
+            yield FME(C, d, n) if C else 0
+
+def _decode_nums(
+        n: int, d: int, cipher_text: Iterable[int],
+        key: PrivateKey = None) -> list:
+    """Return a list of C^d mod n for every cipher C, as _decode_iter."""
+    return list(_decode_iter(n, d, cipher_text, key))
+
+# Default time budget in seconds for each stage of find_factor.
+FACTOR_BUDGETS = {'fermat': 0.5, 'rho': 10.0, 'ecm': 60.0}
+
+# Trial division is always run to completion up to this bound, which is
+# enough to fully factor every n below its square.
+TRIAL_DIVISION_BOUND = 1 << 16
+
+class FactorResult(NamedTuple):
+    """Result of find_factor: a nontrivial factor of n (or 0 if none was
+    found), the method that found it, and the time taken in seconds.
+    The method is 'prime' if n is not composite, and 'exhausted' if
+    every stage ran out of time. break_code_report uses the method
+    'codebook' when it recovers the message without factoring n.
+    """
+    factor: int
+    method: str
+    seconds: float
+
+def find_factor(
+        n: int, budgets: dict = None, seed: int = None) -> FactorResult:
+    """Find a nontrivial factor of n by trying trial division, Fermat's
+    method, Pollard-Brent rho, and the elliptic curve method in turn,
+    each within its time budget (in seconds, defaulting to
+    FACTOR_BUDGETS).
+    The seed makes the randomized stages reproducible.
+    """
+    start = perf_counter()
+    if budgets is None:
+        budgets = FACTOR_BUDGETS
+    rng = Random(seed)
+
+    # Trial division finds the smallest prime factor if it is small, and
+    # proves n prime if n is small enough.
+    p = _trial_division(n, 2, TRIAL_DIVISION_BOUND)
+    if p:
+        return FactorResult(p, 'trial', perf_counter() - start)
+    if n < TRIAL_DIVISION_BOUND ** 2 or is_probable_prime(n):
+        return FactorResult(0, 'prime', perf_counter() - start)
+
+    # Each remaining stage is suited to a different shape of n: Fermat's
+    # method to primes that are close together, rho to a factor up to
+    # about 12 digits, and ECM to larger factors.
+    stages = (('fermat', _fermat), ('rho', _pollard_brent), ('ecm', _ecm))
+    for method, stage in stages:
+        deadline = perf_counter() + budgets.get(method, 0)
+        p = stage(n, deadline, rng)
+        if p:
+            return FactorResult(p, method, perf_counter() - start)
+    return FactorResult(0, 'exhausted', perf_counter() - start)
+
+def _trial_division(n: int, low: int, high: int) -> int:
+    """Return the smallest prime factor of n in [low, high) or 0 if there
+    is none.
+    """
+    if low <= 2 < high and n % 2 == 0 and n > 2:
+        return 2
+
+    # Only primes are tried, read from the sieve, up to the square root
+    # of n.
+    tried = 0
+    for p in SIEVE.primes(max(low, 3), min(high - 1, isqrt(n))):
+        tried += 1
+        if n % p == 0:
+            _count('trial_candidates', tried)
+            return p
+    _count('trial_candidates', tried)
+    return 0
+
+def _fermat(n: int, deadline: float, rng: Random) -> int:
+    """Find a factor of odd n with Fermat's method, which is fast when n
+    has two factors close to its square root.
+    Return 0 if none is found before the deadline.
+    """
+    # Look for a such that a^2 - n = b^2, since then n = (a - b)(a + b).
+    a = isqrt(n)
+    if a * a == n:
+        return a
+    a += 1
+    start = a
+    b2 = a * a - n
+    while perf_counter() < deadline:
+        for _ in range(1024):
+            b = isqrt(b2)
+            if b * b == b2:
+                _count('fermat_candidates', a - start + 1)
+                return a - b
+            # (a + 1)^2 - n = a^2 - n + 2a + 1
+            b2 += 2 * a + 1
+            a += 1
+    _count('fermat_candidates', a - start)
+    return 0
+
+def _pollard_brent(n: int, deadline: float, rng: Random) -> int:
+    """Find a factor of n with Brent's variant of Pollard's rho method.
+    Return 0 if none is found before the deadline.
+    """
+    steps = 0
+    while perf_counter() < deadline:
+        # Iterate f(y) = y^2 + c (mod n) from a random start, doubling the
+        # cycle length r each time, and accumulate m differences into one
+        # product so that only one gcd is needed per batch.
+        y, c, m = rng.randrange(1, n), rng.randrange(1, n), 128
+        g, r, product = 1, 1, 1
+        while g == 1:
+            x = y
+            for _ in range(r):
+                y = (y * y + c) % n
+            steps += r
+            k = 0
+            while k < r and g == 1:
+                saved_y = y
+                for _ in range(min(m, r - k)):
+                    y = (y * y + c) % n
+                    product = product * abs(x - y) % n
+                g = gcd(product, n)
+                steps += min(m, r - k)
+                k += m
+            r *= 2
+            if perf_counter() > deadline:
+                _count('rho_steps', steps)
+                return 0
+
+        # If the whole batch collapsed to n, step through it one value at
+        # a time to find the factor.
+        if g == n:
+            while True:
+                saved_y = (saved_y * saved_y + c) % n
+                g = gcd(abs(x - saved_y), n)
+                if g > 1:
+                    break
+        if g != n:
+            _count('rho_steps', steps)
+            return g
+    _count('rho_steps', steps)
+    return 0
+
+# ECM stage 2 looks for one more prime factor of the group order between
+# B1 and this multiple of B1, comparing the stage 1 point times each
+# prime against baby steps of 2, 4, ..., 2 * ECM_BABY_STEPS times it.
+ECM_B2_FACTOR = 100
+ECM_BABY_STEPS = 105
+
+def _ecm(n: int, deadline: float, rng: Random) -> int:
+    """Find a factor of n with Lenstra's elliptic curve method (Montgomery
+    curves with Suyama's parametrization, with stage 1 up to B1 and
+    stage 2 up to ECM_B2_FACTOR * B1).
+    Try curves with increasing smoothness bounds B1. Return 0 if none is
+    found before the deadline.
+    """
+    for B1, curves in ((2000, 25), (11000, 90), (50000, 300), (250000, 700)):
+        primes = sieve_primes(B1 + 1)
+        plan = _ecm_stage2_plan(B1, ECM_B2_FACTOR * B1)
+        for _ in range(curves):
+            if perf_counter() > deadline:
+                return 0
+            _count('ecm_curves')
+            g = _ecm_curve(n, primes, B1, rng.randrange(6, n - 1), plan)
+            if g:
+                return g
+    return 0
+
+def _ecm_stage2_plan(B1: int, B2: int) -> Tuple[int, list]:
+    """Return the starting multiple r for stage 2 and, for each giant
+    step r, r + 2D, r + 4D, ... (where D is ECM_BABY_STEPS), the baby
+    steps (q - r) / 2 of the primes q between that step and the next.
+    """
+    D = ECM_BABY_STEPS
+    start = B1 - 1 if B1 % 2 == 0 else B1
+    blocks = []
+    for r in range(start, B2, 2 * D):
+        blocks.append(
+            [(q - r) // 2 for q in SIEVE.primes(r + 1, min(r + 2 * D, B2))])
+    return start, blocks
+
+def _ecm_curve(
+        n: int, primes: list, B1: int, sigma: int,
+        plan: Tuple[int, list] = None) -> int:
+    """Run ECM on one curve chosen by sigma: stage 1, then stage 2 if a
+    plan from _ecm_stage2_plan is given.
+    Return a nontrivial factor of n or 0.
+    """
+    # Suyama's parametrization gives a curve By^2 = x^3 + Ax^2 + x whose
+    # group order is divisible by 12, with starting point (x : z).
+    u = (sigma * sigma - 5) % n
+    v = 4 * sigma % n
+    x = pow(u, 3, n)
+    z = pow(v, 3, n)
+    denominator = 16 * x * v % n
+    g = gcd(denominator, n)
+    if g != 1:
+        return g if g != n else 0
+    a24 = pow(v - u, 3, n) * (3 * u + v) * pow(denominator, -1, n) % n
+
+    def double(x: int, z: int) -> Tuple[int, int]:
+        s = (x + z) * (x + z) % n
+        d = (x - z) * (x - z) % n
+        t = s - d
+        return s * d % n, t * (d + a24 * t) % n
+
+    def add(x1: int, z1: int, x2: int, z2: int,
+            xd: int, zd: int) -> Tuple[int, int]:
+        # Add two points whose difference (xd : zd) is known.
+        a = (x1 - z1) * (x2 + z2)
+        b = (x1 + z1) * (x2 - z2)
+        return zd * (a + b) ** 2 % n, xd * (a - b) ** 2 % n
+
+    def multiply(k: int, x: int, z: int) -> Tuple[int, int]:
+        # The Montgomery ladder keeps [j]P and [j + 1]P, whose difference
+        # is always P.
+        x0, z0 = x, z
+        x1, z1 = double(x, z)
+        for bit in bin(k)[3:]:
+            if bit == '1':
+                x0, z0 = add(x0, z0, x1, z1, x, z)
+                x1, z1 = double(x1, z1)
+            else:
+                x1, z1 = add(x0, z0, x1, z1, x, z)
+                x0, z0 = double(x0, z0)
+        return x0, z0
+
+    # Multiply the point by every prime power up to B1.
+    for p in primes:
+        power = p
+        while power * p <= B1:
+            power *= p
+        x, z = multiply(power, x, z)
+
+    # If the order of the point modulo a prime factor of n is B1-smooth,
+    # the point is now the identity modulo that prime, so z shares the
+    # factor with n.
+    g = gcd(z, n)
+    if g != 1 or plan is None:
+        return g if 1 < g < n else 0
+
+    # Stage 2 finds the factor if the order is B1-smooth apart from one
+    # prime q up to B2. Writing q = r + 2j, [q]Q is the identity modulo
+    # the factor exactly when [r]Q = -[2j]Q there, which makes
+    # X_r Z_2j - X_2j Z_r vanish. That difference equals
+    # (X_r - X_2j)(Z_r + Z_2j) - X_r Z_r + X_2j Z_2j, where the last two
+    # products are shared by every q.
+    start, blocks = plan
+    D = ECM_BABY_STEPS
+    steps = [None, double(x, z)]
+    steps.append(double(*steps[1]))
+    for j in range(3, D + 1):
+        steps.append(add(*steps[j - 1], *steps[1], *steps[j - 2]))
+    beta = [0] + [xs * zs % n for xs, zs in steps[1:]]
+    xr, zr = multiply(start, x, z)
+    xt, zt = multiply(start - 2 * D, x, z)
+    xD, zD = steps[D]
+    product = 1
+    for deltas in blocks:
+        alpha = xr * zr % n
+        for j in deltas:
+            xs, zs = steps[j]
+            product = product * (
+                (xr - xs) * (zr + zs) - alpha + beta[j]) % n
+        # Step r forward by 2D; the difference of r and 2D is r - 2D.
+        (xr, zr), xt, zt = add(xr, zr, xD, zD, xt, zt), xr, zr
+    g = gcd(product, n)
+    return g if 1 < g < n else 0
+
+# In parallel mode, trial division continues past TRIAL_DIVISION_BOUND up
+# to this bound, split into one range per worker.
+PARALLEL_TRIAL_BOUND = 1 << 24
+
+def find_factor_parallel(
+        n: int, workers: int = 0, budgets: dict = None,
+        seed: int = None) -> FactorResult:
+    """Find a nontrivial factor of n like find_factor, but spread the work
+    across a pool of worker processes (one per CPU if workers is 0).
+    Trial division ranges are split across the workers, and the
+    randomized methods run independently with different seeds. As soon
+    as any worker finds a factor, all of the others are cancelled.
+    """
+    start = perf_counter()
+    if budgets is None:
+        budgets = FACTOR_BUDGETS
+    if workers <= 0:
+        workers = cpu_count() or 1
+
+    # Small factors and primality are quicker to check than to hand off.
+    p = _trial_division(n, 2, TRIAL_DIVISION_BOUND)
+    if p:
+        return FactorResult(p, 'trial', perf_counter() - start)
+    if n < TRIAL_DIVISION_BOUND ** 2 or is_probable_prime(n):
+        return FactorResult(0, 'prime', perf_counter() - start)
+
+    # The short tasks go first so that their workers move on to the
+    # randomized methods once they are done.
+    rng = Random(seed)
+    tasks = [('fermat', n, budgets.get('fermat', 0), 0, 0, 0)]
+    step = (PARALLEL_TRIAL_BOUND - TRIAL_DIVISION_BOUND) // workers + 1
+    for low in range(TRIAL_DIVISION_BOUND, PARALLEL_TRIAL_BOUND, step):
+        tasks.append(('trial', n, 0, 0, low, low + step))
+    for _ in range(workers):
+        for method in ('rho', 'ecm'):
+            tasks.append(
+                (method, n, budgets.get(method, 0), rng.getrandbits(64), 0, 0))
+
+    # Leaving the with block terminates every worker that is still busy.
+    with Pool(workers) as pool:
+        for p, method in pool.imap_unordered(_factor_task, tasks):
+            if p:
+                return FactorResult(p, method, perf_counter() - start)
+    return FactorResult(0, 'exhausted', perf_counter() - start)
+
+def _factor_task(task: tuple) -> Tuple[int, str]:
+    """Run one find_factor_parallel task in a worker process.
+    Return the factor found (or 0) and the method name.
+    """
+    method, n, budget, seed, low, high = task
+    if method == 'trial':
+        return _trial_division(n, low, high), method
+    stage = {'fermat': _fermat, 'rho': _pollard_brent, 'ecm': _ecm}[method]
+    return stage(n, perf_counter() + budget, Random(seed)), method
+
+def factor_speedup(n: int, workers: int = 0, seed: int = None) -> dict:
+    """Factor n with both find_factor and find_factor_parallel and report
+    the time each took and the speedup of the parallel path.
+    """
+    serial = find_factor(n, seed=seed)
+    parallel = find_factor_parallel(n, workers, seed=seed)
+    return {
+        'workers': workers or cpu_count() or 1,
+        'serial_seconds': serial.seconds,
+        'serial_method': serial.method,
+        'parallel_seconds': parallel.seconds,
+        'parallel_method': parallel.method,
+        'speedup': serial.seconds / parallel.seconds,
+        }
+
+# Code point ranges tried in order by codebook_attack: ASCII, the rest of
+# Latin-1, the rest of the Basic Multilingual Plane, and the
+# supplementary planes.
+CODEBOOK_ATTACK_RANGES = (
+    (0, 0x80), (0x80, 0x100), (0x100, 0x10000), (0x10000, 0x110000))
+
+# Default time budget in seconds for codebook_attack, which is checked
+# after each slice of this many code points.
+CODEBOOK_ATTACK_BUDGET = 10.0
+CODEBOOK_ATTACK_SLICE = 4096
+
+def codebook_attack(
+        n: int, e: int, C: list,
+        budget: float = CODEBOOK_ATTACK_BUDGET) -> str:
+    """Recover a message that was encoded one character at a time using
+    only the public key (n, e), without factoring n.
+    Encrypt the possible characters one range of code points at a time
+    until every cipher in C is accounted for. Return None if some cipher
+    does not correspond to any character or the time budget runs out.
+    """
+    deadline = perf_counter() + budget
+
+    # Encryption with a fixed public key is deterministic and one-to-one
+    # on the integers below n, so each cipher identifies its character.
+    remaining = set(C)
+    if any(c < 0 or c >= n for c in remaining):
+        return None
+    found = {}
+    use_cache = n < CODEBOOK_MAX_N
+    if use_cache:
+        # Ciphers from earlier Encode calls with this key are known.
+        forward, inverse = CODEBOOK.tables(n, e)
+        for c in remaining:
+            if c in inverse:
+                found[c] = inverse[c]
+        remaining -= found.keys()
+
+    for low, high in CODEBOOK_ATTACK_RANGES:
+        high = min(high, n)
+        for start in range(low, high, CODEBOOK_ATTACK_SLICE):
+            if not remaining:
+                break
+            if perf_counter() > deadline:
+                return None
+
+            # Each slice of code points is encrypted into a scratch table
+            # of its own, which is only kept in the codebook if there is
+            # room for it there, so that the attack never evicts the
+            # codebooks of keys that are in use.
+            scratch = {}
+            for M in range(start, min(start + CODEBOOK_ATTACK_SLICE, high)):
+                c = forward.get(M) if use_cache else None
+                if c is None:
+                    c = scratch[M] = FME(M, e, n) if M else 0
+                if c in remaining:
+                    found[c] = M
+                    remaining.discard(c)
+            if use_cache:
+                CODEBOOK.store(n, e, scratch)
+    if remaining:
+        return None
+    return Convert_Num(map(found.__getitem__, C))
+
+def factor_completely(
+        n: int, workers: int = 1,
+        seed: int = None) -> Tuple[list, FactorResult]:
+    """Find every prime factor of n (in increasing order, with repeats)
+    by splitting each composite part with find_factor, or with
+    find_factor_parallel if workers is not 1.
+    Return the primes and a result with the smallest prime (or 0 if n is
+    prime), the method that split the slowest part, and the total time.
+    If some part could not be split in time, return no primes and the
+    result of the failed attempt.
+    """
+    start = perf_counter()
+    primes = []
+    composites = [n]
+    method, slowest = 'prime', -1.0
+    while composites:
+        m = composites.pop()
+        if workers == 1:
+            result = find_factor(m, seed=seed)
+        else:
+            result = find_factor_parallel(m, workers, seed=seed)
+        if result.method == 'prime':
+            primes.append(m)
+            continue
+        if not result.factor:
+            return [], result._replace(seconds=perf_counter() - start)
+        if result.seconds > slowest:
+            method, slowest = result.method, result.seconds
+        composites += [result.factor, m // result.factor]
+    primes.sort()
+    smallest = primes[0] if len(primes) > 1 else 0
+    return primes, FactorResult(smallest, method, perf_counter() - start)
 
 def factorize(n: int):
     """Find the smallest factor ≥2 of a number n or return False if n is
-    not composite.
+    not composite or could not be factored within the time budgets.
     """
-    for i in range(2, n):
-        if n % i == 0:
-            return i
-    return False
+    # A factor found by rho or ECM need not be the smallest, or even
+    # prime, when n has more than two prime factors.
+    primes, result = factor_completely(n)
+    if not result.factor:
+        return False
+    return result.factor
 
-def break_code(n: int, e: int, C: list):
+def break_code(
+        n: int, e: int, C: list, block: bool = False, workers: int = 1):
     """Break an RSA encrypted cipher C using only the public key (n, e).
+    Use block mode if the message was encoded in block mode, and factor
+    n with a pool of worker processes if workers is not 1 (0 means one
+    per CPU).
     """
+    M, result = break_code_report(n, e, C, block, workers)
+    return M
+
+def break_code_report(
+        n: int, e: int, C: list, block: bool = False,
+        workers: int = 1) -> Tuple[str, FactorResult]:
+    """Break an RSA encrypted cipher C using only the public key (n, e).
+    Return the message and the result of factoring n, which reports the
+    method that succeeded.
+    """
+
+    # A message encoded one character at a time can be recovered from
+    # the public key alone, at a cost that depends only on the size of
+    # the alphabet.
+    if not block:
+        start = perf_counter()
+        M = codebook_attack(n, e, C)
+        if M is not None:
+            return M, FactorResult(0, 'codebook', perf_counter() - start)
     
-    # Since we know n is the product of two primes, find the smaller one
-    # through brute force.
-    p = factorize(n) 
-    if p == False:
-        return 'Error: n is supposed to be composite'
-    
-    # The other of the two prime factors must be the quotient.
-    q = n // p 
+    # n is the product of two (or more) distinct primes, so find all of
+    # them.
+    primes, result = factor_completely(n, workers)
+    if result.method == 'prime':
+        return 'Error: n is supposed to be composite', result
+    if not result.factor:
+        return 'Error: n could not be factored in time', result
+    if len(set(primes)) < len(primes):
+        return 'Error: n has a repeated prime factor', result
     
-    # Now that we know not only n and e, but also p and q, we can
+    # Now that we know not only n and e, but also its primes, we can
     # proceed with standard RSA procedures as described above.
-    d = Find_Private_Key_d(e, p, q)
-    M = Decode(n, d, C)
-    return M
+    d = Find_Private_Key_d(e, *primes)
+    M = Decode(n, d, C, Build_Private_Key(d, *primes), block)
+    return M, result
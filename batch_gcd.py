@@ -0,0 +1,142 @@
+from argparse import ArgumentParser
+from decimal import (
+    MAX_EMAX, MAX_PREC, MIN_EMIN, Context, Decimal, DivisionByZero, Inexact,
+    InvalidOperation, Overflow, localcontext)
+from math import gcd
+from typing import Iterable, Iterator, List, Tuple
+
+import RSA_calculations as rsacalc
+
+# The products and remainders in the trees have millions of digits, where
+# the built-in int's multiplication and division are quadratic. The
+# decimal module uses number-theoretic transform multiplication and
+# Newton division for numbers this large, so the trees are built with
+# exact Decimal integers instead (any rounding raises an exception).
+_EXACT = Context(
+    prec=MAX_PREC, Emax=MAX_EMAX, Emin=MIN_EMIN,
+    traps=[DivisionByZero, Inexact, InvalidOperation, Overflow])
+
+
+def read_keys(path: str) -> Iterator[Tuple[int, int]]:
+    """Read public keys (n, e) from a file with one key per line, written
+    as 'n e', 'n, e', or '(n, e)'. Blank lines and lines starting with #
+    are skipped.
+    """
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            fields = line.strip('()').replace(',', ' ').split()
+            yield int(fields[0]), int(fields[1])
+
+def product_tree(moduli: List[int]) -> List[List[int]]:
+    """Build a product tree over the moduli.
+    Return its levels from the leaves (the moduli themselves) up to the
+    root (the product of all of them).
+    """
+    tree = [moduli]
+    while len(tree[-1]) > 1:
+        level = tree[-1]
+        parents = []
+        for i in range(0, len(level) - 1, 2):
+            parents.append(level[i] * level[i + 1])
+        if len(level) % 2:
+            parents.append(level[-1])
+        tree.append(parents)
+    return tree
+
+def remainder_tree(
+        value: int, tree: List[List[int]], square: bool) -> List[int]:
+    """Reduce value modulo every leaf of the product tree (or modulo the
+    square of every leaf if square is True) by reducing it modulo each
+    node on the way down from the root.
+    """
+    remainders = [value]
+    for level in reversed(tree):
+        reduced = []
+        for i, node in enumerate(level):
+            modulus = node * node if square else node
+            reduced.append(remainders[i // 2] % modulus)
+        remainders = reduced
+    return remainders
+
+def shared_factors(
+        moduli: List[int], chunk_size: int = 16384) -> List[int]:
+    """Return gcd(n, product of all the other moduli) for every modulus n.
+    The moduli are processed in chunks so that only one product tree
+    (plus the product of every chunk) is in memory at a time.
+    """
+    with localcontext(_EXACT):
+        chunks = []
+        for i in range(0, len(moduli), chunk_size):
+            chunks.append(moduli[i:i + chunk_size])
+        products = []
+        for chunk in chunks:
+            products.append(product_tree([Decimal(n) for n in chunk])[-1][0])
+
+        results = []
+        for i, chunk in enumerate(chunks):
+            tree = product_tree([Decimal(n) for n in chunk])
+
+            # Within the chunk, (P mod n^2) / n = (P / n) mod n, the
+            # product of the other moduli in the chunk (mod n).
+            accumulated = []
+            squared = remainder_tree(products[i], tree, True)
+            for n, z in zip(chunk, squared):
+                accumulated.append(int(z) // n % n)
+
+            # Fold in the products of all of the other chunks (mod n).
+            for j, product in enumerate(products):
+                if j != i:
+                    remainders = remainder_tree(product, tree, False)
+                    for k, r in enumerate(remainders):
+                        accumulated[k] = accumulated[k] * int(r) % chunk[k]
+
+            for n, a in zip(chunk, accumulated):
+                results.append(gcd(a, n))
+    return results
+
+def scan(
+        keys: Iterable[Tuple[int, int]],
+        chunk_size: int = 16384) -> Iterator[Tuple[int, int, int, int, int]]:
+    """Find every public key (n, e) that shares a prime with another key
+    and yield its (n, e, p, q, d).
+    """
+    keys = list(keys)
+    moduli = [n for n, e in keys]
+    factors = shared_factors(moduli, chunk_size)
+
+    # If both primes of n are shared (with different keys), the gcd is n
+    # itself, so split it against the other weak moduli one at a time.
+    weak = [n for n, g in zip(moduli, factors) if g > 1]
+    for (n, e), g in zip(keys, factors):
+        if g == n:
+            g = 1
+            for m in weak:
+                h = gcd(n, m)
+                if 1 < h < n:
+                    g = h
+                    break
+        if g == 1:
+            continue
+        p, q = g, n // g
+        if gcd(e, (p - 1) * (q - 1)) != 1:
+            continue
+        yield n, e, p, q, rsacalc.Find_Private_Key_d(e, p, q)
+
+def main() -> None:
+    parser = ArgumentParser(
+        description=('Find public keys that share a prime factor and '
+                     'recover their private keys.'))
+    parser.add_argument(
+        'path', help="file with one public key 'n e' per line")
+    parser.add_argument(
+        '--chunk-size', type=int, default=16384,
+        help='number of moduli per product tree (bounds memory use)')
+    args = parser.parse_args()
+    for n, e, p, q, d in scan(read_keys(args.path), args.chunk_size):
+        print(n, e, p, q, d)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+import json
+import platform
+import sys
+from argparse import ArgumentParser
+from random import Random
+from time import perf_counter
+from typing import Callable, Dict, List
+
+import RSA_calculations as rsacalc
+import signatures
+
+# Fixed seed so every run benchmarks exactly the same inputs.
+SEED = 2024
+
+# A benchmark is slower than its baseline once its time grows by more
+# than this fraction.
+DEFAULT_THRESHOLD = 0.25
+
+
+def time_call(func: Callable[[], object], min_time: float = 0.2) -> dict:
+    """Time func, repeating it until at least min_time seconds have
+    passed, and return the best and mean time per call in seconds and
+    the best throughput in items (see per_item) per second.
+    """
+    times = []
+    start = perf_counter()
+    while True:
+        t = perf_counter()
+        func()
+        times.append(perf_counter() - t)
+        if perf_counter() - start >= min_time and len(times) >= 3:
+            break
+    return {
+        'best': min(times),
+        'mean': sum(times) / len(times),
+        'runs': len(times),
+        'per_second': getattr(func, 'items', 1) / min(times),
+        }
+
+def per_item(func: Callable[[], object], items: int) -> Callable:
+    """Mark a benchmark as handling the given number of items per call,
+    so that its throughput is reported in items per second.
+    """
+    func.items = items
+    return func
+
+def _random_prime(rng: Random, bits: int) -> int:
+    """Return a reproducible random prime with the given number of bits."""
+    while True:
+        candidate = rng.getrandbits(bits) | (1 << (bits - 1)) | 1
+        if rsacalc.is_probable_prime(candidate):
+            return candidate
+
+def _key(rng: Random, bits: int) -> tuple:
+    """Return a reproducible key (n, e, d, p, q) with primes of the given
+    number of bits.
+    """
+    p, q = _primes(rng, bits, 2)
+    n, e = rsacalc.Find_Public_Key_e(p, q)
+    d = rsacalc.Find_Private_Key_d(e, p, q)
+    return n, e, d, p, q
+
+def _primes(rng: Random, bits: int, count: int) -> list:
+    """Return a reproducible list of count distinct primes with the given
+    number of bits.
+    """
+    primes = []
+    while len(primes) < count:
+        p = _random_prime(rng, bits)
+        if p not in primes:
+            primes.append(p)
+    return primes
+
+def _message(rng: Random, length: int) -> str:
+    """Return a reproducible message of mostly ASCII text."""
+    alphabet = ('abcdefghijklmnopqrstuvwxyz'
+                'ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789 .,éü')
+    return ''.join(rng.choice(alphabet) for _ in range(length))
+
+def build_benchmarks(quick: bool = False) -> Dict[str, Callable]:
+    """Build the benchmark cases as a dict from name to a function with
+    no arguments.
+    If quick is True, use fewer and smaller cases.
+    """
+    rng = Random(SEED)
+    cases = {}
+
+    for bits in ((64, 1024) if quick else (64, 1024, 2048)):
+        b = rng.getrandbits(bits) | 1
+        x = rng.getrandbits(bits) | 1
+        m = rng.getrandbits(bits) | (1 << (bits - 1)) | 1
+        cases[f'FME/{bits}bit'] = lambda b=b, x=x, m=m: rsacalc.FME(b, x, m)
+        cases[f'Euclidean_Alg/{bits}bit'] = (
+            lambda b=b, m=m: rsacalc.Euclidean_Alg(m, b))
+        cases[f'EEA/{bits}bit'] = lambda b=b, m=m: rsacalc.EEA(m, b)
+
+    for bits in ((11, 512) if quick else (11, 512, 1024)):
+        n, e, d, p, q = _key(rng, bits)
+        cases[f'Find_Public_Key_e/{bits}bit'] = (
+            lambda p=p, q=q: rsacalc.Find_Public_Key_e(p, q))
+        cases[f'Find_Private_Key_d/{bits}bit'] = (
+            lambda e=e, p=p, q=q: rsacalc.Find_Private_Key_d(e, p, q))
+
+    # Encode and Decode across message lengths, with a toy key (as from
+    # the menu) and a realistic one. The codebook cache is cleared first
+    # so repeated runs measure the same work.
+    for bits in ((11, 512) if quick else (11, 1024)):
+        n, e, d, p, q = _key(rng, bits)
+        key = rsacalc.Build_Private_Key(d, p, q)
+        lengths = (16, 256) if quick or bits > 64 else (16, 256, 4096)
+        for length in lengths:
+            message = _message(rng, length)
+            C = rsacalc.Encode(n, e, message)
+
+            def encode(n=n, e=e, message=message):
+                rsacalc.CODEBOOK.clear()
+                rsacalc.Encode(n, e, message)
+
+            def decode(n=n, d=d, C=C, key=key):
+                rsacalc.CODEBOOK.clear()
+                rsacalc.Decode(n, d, C, key)
+
+            cases[f'Encode/{bits}bit/{length}chars'] = encode
+            cases[f'Decode/{bits}bit/{length}chars'] = decode
+            if bits > 64:
+                block_C = rsacalc.Encode(n, e, message, block=True)
+                cases[f'Encode_block/{bits}bit/{length}chars'] = (
+                    lambda n=n, e=e, message=message:
+                    rsacalc.Encode(n, e, message, block=True))
+                cases[f'Decode_block/{bits}bit/{length}chars'] = (
+                    lambda n=n, d=d, C=block_C, key=key:
+                    rsacalc.Decode(n, d, C, key, block=True))
+
+    # factorize and break_code across digit counts of n.
+    for digits in ((6, 12) if quick else (6, 12, 18, 24)):
+        bits = int(digits * 3.33 / 2)
+        n, e, d, p, q = _key(rng, bits)
+        C = rsacalc.Encode(n, e, 'Hi', block=n.bit_length() > 16)
+        cases[f'factorize/{digits}digits'] = (
+            lambda n=n: rsacalc.find_factor(n, seed=SEED))
+        cases[f'break_code/{digits}digits'] = (
+            lambda n=n, e=e, C=C: rsacalc.break_code(
+                n, e, C, block=n.bit_length() > 16))
+
+    # CRT decoding of one block with two, three, and four primes of the
+    # same modulus size. (These come last so that adding them did not
+    # change the inputs of the cases above.)
+    for primes in (2, 3, 4):
+        bits = 1536 // primes if quick else 3072 // primes
+        key_primes = _primes(rng, bits, primes)
+        n, e = rsacalc.Find_Public_Key_e(*key_primes)
+        d = rsacalc.Find_Private_Key_d(e, *key_primes)
+        key = rsacalc.Build_Private_Key(d, *key_primes)
+        C = rng.randrange(2, n)
+        cases[f'CRT_Decode/{primes * bits}bit/{primes}primes'] = (
+            lambda C=C, key=key: rsacalc.CRT_Decode(C, key))
+
+    # Signature throughput, one at a time and in a batch.
+    for bits in ((512,) if quick else (1024,)):
+        n, e, d, p, q = _key(rng, bits)
+        key = rsacalc.Build_Private_Key(d, p, q)
+        count = 200 if quick else 2000
+        items = []
+        for i in range(count):
+            message = _message(rng, 64)
+            items.append((message, signatures.sign(n, d, message, key)))
+        cases[f'sign/{2 * bits}bit'] = (
+            lambda n=n, d=d, message=items[0][0], key=key:
+            signatures.sign(n, d, message, key))
+        cases[f'verify/{2 * bits}bit/{count}sigs'] = per_item(
+            lambda n=n, e=e, items=items:
+            [signatures.verify(n, e, m, s) for m, s in items], count)
+        cases[f'verify_batch/{2 * bits}bit/{count}sigs'] = per_item(
+            lambda n=n, e=e, items=items:
+            signatures.verify_batch(n, e, items), count)
+    return cases
+
+def check_verify_batch() -> List[str]:
+    """Check that verify_batch reports exactly the invalid signatures in
+    batches whose signatures were swapped between messages or tampered
+    with, and return a description of every check that failed.
+    """
+    rng = Random(SEED)
+    n, e, d, p, q = _key(rng, 512)
+    key = rsacalc.Build_Private_Key(d, p, q)
+    items = []
+    for i in range(40):
+        message = _message(rng, 32)
+        items.append((message, signatures.sign(n, d, message, key)))
+    (a, sig_a), (b, sig_b) = items[:2]
+
+    swapped = list(items)
+    swapped[3] = (items[3][0], items[7][1])
+    swapped[7] = (items[7][0], items[3][1])
+
+    # Multiplying one signature by x and another by 1/x leaves the plain
+    # product of the signatures unchanged.
+    x = rng.randrange(2, n)
+    tampered = list(items)
+    tampered[5] = (items[5][0], items[5][1] * x % n)
+    tampered[11] = (items[11][0], items[11][1] * pow(x, -1, n) % n)
+    tampered[20] = (items[20][0], (items[20][1] + 1) % n)
+
+    # n - s raised to e is -h, which a product screen with random
+    # exponents accepts whenever the exponent is even.
+    negated = list(items)
+    negated[9] = (items[9][0], n - items[9][1])
+
+    checks = (
+        ('valid', items, []),
+        ('swapped pair', [(a, sig_b), (b, sig_a)], [0, 1]),
+        ('swapped in batch', swapped, [3, 7]),
+        ('tampered in batch', tampered, [5, 11, 20]),
+        ('negated in batch', negated, [9]),
+        )
+    failures = []
+    for name, batch, expected in checks:
+        invalid = signatures.verify_batch(n, e, batch)
+        if invalid != expected:
+            failures.append(f'verify_batch {name}: expected {expected}, '
+                            f'got {invalid}')
+    return failures
+
+def check_backends() -> List[str]:
+    """Check that every exponentiation and GCD backend agrees with the
+    original implementation, and return a description of every check
+    that failed.
+    """
+    failures = []
+    for name, cross_check in (('FME', rsacalc.cross_check_FME),
+                              ('GCD', rsacalc.cross_check_gcd)):
+        try:
+            cross_check()
+        except AssertionError as exc:
+            failures.append(f'{name} backends: {exc}')
+    return failures
+
+def run(quick: bool = False, pattern: str = '') -> dict:
+    """Run the benchmarks whose names contain pattern and return the
+    results with some information about the environment.
+    """
+    results = {}
+    for name, func in build_benchmarks(quick).items():
+        if pattern in name:
+            results[name] = time_call(func)
+            print(f'{name:45} {results[name]["best"] * 1e3:12.4f} ms '
+                  f'{results[name]["per_second"]:14.1f}/s',
+                  file=sys.stderr)
+    return {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'quick': quick,
+        'results': results,
+        }
+
+def compare(
+        current: dict, baseline: dict,
+        threshold: float = DEFAULT_THRESHOLD) -> List[str]:
+    """Compare two sets of results by best time and return a description
+    of every benchmark that regressed by more than the threshold.
+    """
+    regressions = []
+    for name, result in current['results'].items():
+        old = baseline['results'].get(name)
+        if old is None:
+            continue
+        ratio = result['best'] / old['best']
+        if ratio > 1 + threshold:
+            regressions.append(
+                f'{name}: {old["best"] * 1e3:.4f} ms -> '
+                f'{result["best"] * 1e3:.4f} ms ({ratio:.2f}x)')
+    return regressions
+
+def main() -> None:
+    parser = ArgumentParser(
+        description='Benchmark the hot paths of RSA_calculations.')
+    parser.add_argument(
+        '--quick', action='store_true', help='run fewer, smaller cases')
+    parser.add_argument(
+        '-k', dest='pattern', default='',
+        help='only run benchmarks whose names contain this string')
+    parser.add_argument(
+        '-o', '--output', help='write the results as JSON to this file')
+    parser.add_argument(
+        '--baseline', help='compare against results saved in this file')
+    parser.add_argument(
+        '--threshold', type=float, default=DEFAULT_THRESHOLD,
+        help='slowdown fraction that counts as a regression')
+    args = parser.parse_args()
+
+    # Timing a batch check is only meaningful if it gives right answers.
+    # Timings of a backend that gives wrong results are meaningless.
+    failures = check_backends() + check_verify_batch()
+    for failure in failures:
+        print('FAILED', failure, file=sys.stderr)
+    if failures:
+        sys.exit(1)
+
+    current = run(args.quick, args.pattern)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(current, f, indent=2)
+    else:
+        json.dump(current, sys.stdout, indent=2)
+        print()
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(current, baseline, args.threshold)
+        for regression in regressions:
+            print('REGRESSION', regression, file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
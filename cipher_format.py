@@ -0,0 +1,155 @@
+import mmap
+import struct
+from typing import BinaryIO, Iterable, Iterator
+
+# Binary cipher text files start with a header:
+#   magic (4 bytes), format version (1 byte), flags (1 byte),
+#   bit length of n (2 bytes), block width in bytes (2 bytes),
+#   number of blocks (8 bytes),
+# all big-endian, followed by the blocks themselves, each a big-endian
+# integer of exactly block width bytes.
+MAGIC = b'RSAC'
+VERSION = 1
+HEADER = struct.Struct('>4sBBHHQ')
+
+# Flag set when the cipher text was encoded in block mode.
+FLAG_BLOCK = 0x01
+
+# Block count written when the count is not known up front and the
+# output cannot be rewound to fill it in; readers then infer it from
+# the size of the data.
+UNKNOWN_COUNT = 2 ** 64 - 1
+
+
+def block_width(n: int) -> int:
+    """Return the number of bytes needed for any cipher less than n."""
+    return (n.bit_length() + 7) // 8
+
+def write_ciphertext(
+        f: BinaryIO, n: int, cipher_text: Iterable[int],
+        block: bool = False) -> int:
+    """Write numeric cipher text for modulus n to a binary file, one
+    fixed-width block at a time.
+    Return the number of blocks written.
+    """
+    width = block_width(n)
+    flags = FLAG_BLOCK if block else 0
+    seekable = f.seekable()
+    start = f.tell() if seekable else 0
+    f.write(HEADER.pack(
+        MAGIC, VERSION, flags, n.bit_length(), width, UNKNOWN_COUNT))
+
+    count = 0
+    for C in cipher_text:
+        f.write(C.to_bytes(width, 'big'))
+        count += 1
+
+    # Fill in the real count now that it is known.
+    if seekable:
+        end = f.tell()
+        f.seek(start)
+        f.write(HEADER.pack(
+            MAGIC, VERSION, flags, n.bit_length(), width, count))
+        f.seek(end)
+    return count
+
+def parse_header(header: bytes) -> tuple:
+    """Unpack and check a header, returning (flags, n_bits, width,
+    count).
+    """
+    if len(header) < HEADER.size:
+        raise ValueError('file is too short to be binary cipher text')
+    magic, version, flags, n_bits, width, count = HEADER.unpack(header)
+    if magic != MAGIC:
+        raise ValueError('not a binary cipher text file')
+    if version != VERSION:
+        raise ValueError(f'unsupported cipher text format version {version}')
+    if width == 0:
+        raise ValueError('invalid block width 0')
+    return flags, n_bits, width, count
+
+def is_binary_ciphertext(prefix: bytes) -> bool:
+    """Check whether the first bytes of a file mark it as binary cipher
+    text.
+    """
+    return prefix[:len(MAGIC)] == MAGIC
+
+class CiphertextReader:
+    """Read a binary cipher text file through a memory map.
+    Iterating over the reader yields the blocks as integers, converted
+    straight from views into the mapped file without copying the data.
+    """
+
+    def __init__(self, path: str) -> None:
+        self._file = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(
+                self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError('file is too short to be binary cipher text')
+        self._view = memoryview(self._map)
+        flags, self.n_bits, self.width, count = parse_header(
+            self._view[:HEADER.size])
+        self.block = bool(flags & FLAG_BLOCK)
+
+        available = (len(self._map) - HEADER.size) // self.width
+        if count == UNKNOWN_COUNT:
+            count = available
+        elif count > available:
+            raise ValueError('binary cipher text is truncated')
+        self.count = count
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, i: int) -> int:
+        if not 0 <= i < self.count:
+            raise IndexError('block index out of range')
+        start = HEADER.size + i * self.width
+        return int.from_bytes(self._view[start:start + self.width], 'big')
+
+    def __iter__(self) -> Iterator[int]:
+        view, width = self._view, self.width
+        end = HEADER.size + self.count * width
+        for start in range(HEADER.size, end, width):
+            yield int.from_bytes(view[start:start + width], 'big')
+
+    def close(self) -> None:
+        """Release the memory map and close the file."""
+        self._view.release()
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self) -> 'CiphertextReader':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+def read_ciphertext_stream(f: BinaryIO) -> Iterator[int]:
+    """Read binary cipher text from a stream that cannot be memory mapped
+    (such as a pipe), yielding the blocks as integers.
+    """
+    flags, n_bits, width, count = parse_header(f.read(HEADER.size))
+    remaining = count
+    while remaining:
+        # Read many blocks at a time but convert them one by one.
+        want = width * (min(remaining, 4096) if count != UNKNOWN_COUNT
+                        else 4096)
+        data = f.read(want)
+        if not data:
+            if count != UNKNOWN_COUNT:
+                raise ValueError('binary cipher text is truncated')
+            return
+        # A short read of a pipe can end partway through a block.
+        while len(data) % width:
+            more = f.read(width - len(data) % width)
+            if not more:
+                raise ValueError('binary cipher text is truncated')
+            data += more
+        view = memoryview(data)
+        for start in range(0, len(data), width):
+            yield int.from_bytes(view[start:start + width], 'big')
+        if count != UNKNOWN_COUNT:
+            remaining -= len(data) // width
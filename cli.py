@@ -0,0 +1,320 @@
+import json
+import os
+import sys
+from argparse import ArgumentParser, Namespace
+from io import TextIOWrapper
+from typing import Iterable, Iterator, List, TextIO, Tuple
+
+import hybrid
+import RSA_calculations as rsacalc
+from cipher_format import (
+    FLAG_BLOCK, HEADER, CiphertextReader, is_binary_ciphertext, parse_header,
+    read_ciphertext_stream, write_ciphertext)
+
+# Number of characters (or bytes in block mode) read from the input at a
+# time, so memory use stays constant no matter how large the input is.
+CHUNK_SIZE = 1 << 16
+
+_SEPARATORS = str.maketrans(',[]', '   ')
+
+
+def read_chunks(f, size: int = CHUNK_SIZE) -> Iterator:
+    """Yield the contents of a file in chunks of at most size characters
+    (or bytes for a binary file).
+    """
+    while True:
+        chunk = f.read(size)
+        if not chunk:
+            return
+        yield chunk
+
+def read_cipher_ints(f: TextIO, size: int = CHUNK_SIZE) -> Iterator[int]:
+    """Yield the integers of numeric cipher text written either one per
+    line or as a list like [321, 654, 987], reading it in chunks.
+    """
+    partial = ''
+    for chunk in read_chunks(f, size):
+        # Treat the brackets and commas of the list format as whitespace.
+        tokens = (partial + chunk.translate(_SEPARATORS)).split()
+
+        # The last token may continue in the next chunk.
+        if chunk[-1].isdigit():
+            partial = tokens.pop()
+        else:
+            partial = ''
+        for token in tokens:
+            yield int(token)
+    if partial:
+        yield int(partial)
+
+def open_ciphertext(path: str) -> Tuple[Iterable[int], bool]:
+    """Open cipher text in either the binary format (memory mapped when
+    it is a file) or the text format, detected from its first bytes.
+    Return the cipher text integers and whether the file says it was
+    encoded in block mode.
+    """
+    if path != '-':
+        with open(path, 'rb') as f:
+            prefix = f.read(4)
+        if is_binary_ciphertext(prefix):
+            reader = CiphertextReader(path)
+            return reader, reader.block
+        return read_cipher_ints(open(path, encoding='utf-8')), False
+    stream = sys.stdin.buffer
+    prefix = stream.peek(HEADER.size)
+    if is_binary_ciphertext(prefix):
+        block = False
+        if len(prefix) >= HEADER.size:
+            flags = parse_header(prefix[:HEADER.size])[0]
+            block = bool(flags & FLAG_BLOCK)
+        return read_ciphertext_stream(stream), block
+    return read_cipher_ints(TextIOWrapper(stream, encoding='utf-8')), False
+
+def peek_input(path: str, size: int) -> bytes:
+    """Return the first bytes of the input file, or of standard input
+    without consuming them.
+    """
+    if path == '-':
+        return sys.stdin.buffer.peek(size)[:size]
+    with open(path, 'rb') as f:
+        return f.read(size)
+
+def load_key(args: Namespace) -> dict:
+    """Collect the key values from the key file (if any), letting values
+    given directly on the command line override them.
+    """
+    key = {}
+    if args.key:
+        with open(args.key) as f:
+            key = json.load(f)
+    for name in ('n', 'e', 'd'):
+        value = getattr(args, name, None)
+        if value is not None:
+            key[name] = value
+    return key
+
+def require(key: dict, names: tuple) -> None:
+    """Exit with an error message if any of the key values are missing."""
+    for name in names:
+        if name not in key:
+            sys.exit(f'error: missing key value {name} '
+                     '(use --key or pass it directly)')
+
+def open_input(path: str, binary: bool):
+    """Open the input file, or standard input for '-'."""
+    # newline='' keeps '\r\n' and '\r' in the message as they are.
+    if path == '-':
+        if binary:
+            return sys.stdin.buffer
+        return TextIOWrapper(sys.stdin.buffer, encoding='utf-8', newline='')
+    if binary:
+        return open(path, 'rb')
+    return open(path, 'r', encoding='utf-8', newline='')
+
+def open_output(path: str, binary: bool):
+    """Open the output file, or standard output for '-'."""
+    # newline='' writes line endings exactly as decrypted.
+    if path == '-':
+        if binary:
+            return sys.stdout.buffer
+        return TextIOWrapper(sys.stdout.buffer, encoding='utf-8', newline='')
+    if binary:
+        return open(path, 'wb')
+    return open(path, 'w', encoding='utf-8', newline='')
+
+def open_key_output(path: str) -> TextIO:
+    """Open the output file for private keys, or standard output for
+    '-'. A new file can only be read and written by its owner.
+    """
+    if path == '-':
+        return sys.stdout
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    return open(fd, 'w', encoding='utf-8')
+
+def keygen_command(args: Namespace) -> None:
+    """Generate a key pair and write it as JSON, or with --count, write
+    that many key pairs one JSON object per line as they are made.
+    """
+    if args.count is not None:
+        if args.primes != 2:
+            sys.exit('error: --count only makes keys with two primes')
+        out = open_key_output(args.output)
+        keys = rsacalc.bulk_keygen(args.count, args.bits, args.processes)
+        for n, e, d, p, q in keys:
+            json.dump({'n': n, 'e': e, 'd': d, 'p': p, 'q': q}, out)
+            out.write('\n')
+        out.flush()
+        return
+    p, q, *more_primes = rsacalc.generate_key_primes(
+        args.bits, args.primes, args.processes)
+    n, e = rsacalc.Find_Public_Key_e(p, q, *more_primes)
+    d = rsacalc.Find_Private_Key_d(e, p, q, *more_primes)
+    key = {'n': n, 'e': e, 'd': d, 'p': p, 'q': q}
+    if more_primes:
+        key['more_primes'] = more_primes
+    out = open_key_output(args.output)
+    json.dump(key, out)
+    out.write('\n')
+    out.flush()
+
+def encrypt_command(args: Namespace) -> None:
+    """Encrypt the input and write the cipher text one integer per line."""
+    key = load_key(args)
+    require(key, ('n', 'e'))
+    if args.format == 'hybrid':
+        out = open_output(args.output, True)
+        hybrid.encrypt_file(
+            key['n'], key['e'], open_input(args.input, True), out)
+        out.flush()
+        return
+    source = open_input(args.input, args.block)
+    ciphers = rsacalc.Encode_Stream(
+        key['n'], key['e'], read_chunks(source), args.block)
+    if args.format == 'binary':
+        out = open_output(args.output, True)
+        write_ciphertext(out, key['n'], ciphers, args.block)
+    else:
+        out = open_output(args.output, False)
+        for C in ciphers:
+            out.write(f'{C}\n')
+    out.flush()
+
+def decrypt_command(args: Namespace) -> None:
+    """Decrypt cipher text from the input and write the message."""
+    key = load_key(args)
+    require(key, ('n', 'd'))
+    n, d = key['n'], key['d']
+    private_key = None
+    if 'p' in key and 'q' in key:
+        primes = [key['p'], key['q']] + key.get('more_primes', [])
+        product = 1
+        for r in primes:
+            product *= r
+        if product == n:
+            private_key = rsacalc.Build_Private_Key(d, *primes)
+    if hybrid.is_hybrid_ciphertext(peek_input(args.input, 4)):
+        decrypt_hybrid(args, n, d, private_key)
+        return
+    cipher_text, block = open_ciphertext(args.input)
+    block = block or args.block
+    out = open_output(args.output, block)
+    chunks = rsacalc.Decode_Stream(n, d, cipher_text, private_key, block)
+    for chunk in chunks:
+        out.write(chunk)
+    out.flush()
+
+def decrypt_hybrid(
+        args: Namespace, n: int, d: int,
+        private_key: rsacalc.PrivateKey) -> None:
+    """Decrypt hybrid cipher text from the input and write the message.
+    An output file is first written under a temporary name and only
+    renamed once the whole cipher text has been authenticated, so a
+    tampered or truncated input never leaves a partial message behind.
+    """
+    source = open_input(args.input, True)
+    if args.output == '-':
+        # Standard output only gets chunks whose tags have checked out,
+        # but may end early if the input is cut short.
+        out = sys.stdout.buffer
+        try:
+            hybrid.decrypt_file(n, d, source, out, private_key)
+        except ValueError as exc:
+            sys.exit(f'error: {exc}')
+        out.flush()
+        return
+    temporary = f'{args.output}.tmp'
+    try:
+        with open(temporary, 'wb') as out:
+            hybrid.decrypt_file(n, d, source, out, private_key)
+        os.replace(temporary, args.output)
+    except ValueError as exc:
+        os.remove(temporary)
+        sys.exit(f'error: {exc}')
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+
+def break_command(args: Namespace) -> None:
+    """Break cipher text using only the public key and write the
+    message.
+    """
+    key = load_key(args)
+    require(key, ('n', 'e'))
+    cipher_text, block = open_ciphertext(args.input)
+    M, result = rsacalc.break_code_report(
+        key['n'], key['e'], list(cipher_text), block or args.block,
+        args.workers)
+    print(f'method: {result.method} ({result.seconds:.3f} s)',
+          file=sys.stderr)
+    out = open_output(args.output, False)
+    out.write(M)
+    out.flush()
+
+def build_parser() -> ArgumentParser:
+    """Build the parser for the command line subcommands."""
+    parser = ArgumentParser(
+        prog='main.py',
+        description=('Non-interactive RSA commands. Run without arguments '
+                     'for the interactive menu.'))
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    keygen = commands.add_parser('keygen', help='generate a key pair')
+    keygen.add_argument(
+        '--bits', type=int, default=1024, help='size of each prime in bits')
+    keygen.add_argument(
+        '--processes', type=int, default=1,
+        help=('worker processes for the prime search (0 for one per CPU '
+              'with --count)'))
+    keygen.add_argument(
+        '--primes', type=int, choices=(2, 3, 4), default=2,
+        help=('number of primes in n (more primes make decryption '
+              'faster)'))
+    keygen.add_argument(
+        '--count', type=int,
+        help='generate this many key pairs, one JSON object per line')
+    keygen.set_defaults(func=keygen_command)
+
+    encrypt = commands.add_parser('encrypt', help='encrypt a message')
+    encrypt.add_argument('-n', type=int, help='public key n')
+    encrypt.add_argument('-e', type=int, help='public key e')
+    encrypt.add_argument(
+        '--format', choices=('text', 'binary', 'hybrid'), default='text',
+        help=('cipher text format: one integer per line, fixed-width '
+              'binary blocks, or a wrapped session key and a symmetric '
+              'cipher for fast bulk encryption (decrypt detects the '
+              'format automatically)'))
+    encrypt.set_defaults(func=encrypt_command)
+
+    decrypt = commands.add_parser('decrypt', help='decrypt cipher text')
+    decrypt.add_argument('-n', type=int, help='private key n')
+    decrypt.add_argument('-d', type=int, help='private key d')
+    decrypt.set_defaults(func=decrypt_command)
+
+    breaker = commands.add_parser(
+        'break', help='break cipher text using only the public key')
+    breaker.add_argument('-n', type=int, help='public key n')
+    breaker.add_argument('-e', type=int, help='public key e')
+    breaker.add_argument(
+        '--workers', type=int, default=1,
+        help='worker processes for factoring (0 for one per CPU)')
+    breaker.set_defaults(func=break_command)
+
+    for command in (encrypt, decrypt, breaker):
+        command.add_argument(
+            '--key', help='JSON key file as written by keygen')
+        command.add_argument(
+            '--block', action='store_true',
+            help='pack the UTF-8 bytes of the message into blocks')
+        command.add_argument(
+            '-i', '--input', default='-', help='input file (default stdin)')
+    for command in (keygen, encrypt, decrypt, breaker):
+        command.add_argument(
+            '-o', '--output', default='-',
+            help='output file (default stdout)')
+    return parser
+
+def run(argv: List[str]) -> None:
+    """Run the subcommand given by the command line arguments."""
+    args = build_parser().parse_args(argv)
+    args.func(args)
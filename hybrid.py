@@ -0,0 +1,220 @@
+import hmac
+import struct
+from itertools import chain
+from hashlib import blake2b, shake_128
+from secrets import token_bytes
+from typing import BinaryIO, Iterator, Tuple
+
+import RSA_calculations as rsacalc
+from RSA_calculations import np
+
+# Hybrid cipher text starts with a header:
+#   magic (4 bytes), format version (1 byte), width in bytes of each
+#   wrapped key block (2 bytes), number of wrapped key blocks (2 bytes),
+#   nonce (16 bytes),
+# all big-endian, followed by the wrapped key blocks and then the
+# encrypted message in records. Each record is one chunk of the message
+# followed by its own authentication tag, and every record but the last
+# holds a full chunk, so the last one is recognized by being shorter
+# (an empty message still gets a record with an empty chunk).
+MAGIC = b'RSAH'
+VERSION = 2
+HEADER = struct.Struct('>4sBHH16s')
+
+SESSION_KEY_SIZE = 32
+TAG_SIZE = 32
+
+# The keystream is generated in chunks of this many bytes, each from its
+# own SHAKE128 call keyed by the session key, nonce, and chunk number, so
+# a message of any size is encrypted in constant memory.
+CHUNK_SIZE = 1 << 20
+RECORD_SIZE = CHUNK_SIZE + TAG_SIZE
+
+
+def _derive_keys(session_key: bytes) -> Tuple[bytes, bytes]:
+    """Derive separate encryption and authentication keys from the
+    session key.
+    """
+    encryption_key = blake2b(
+        session_key, digest_size=32, person=b'RSA hybrid enc').digest()
+    mac_key = blake2b(
+        session_key, digest_size=32, person=b'RSA hybrid mac').digest()
+    return encryption_key, mac_key
+
+def _keystream(encryption_key: bytes, nonce: bytes, index: int,
+               length: int) -> bytes:
+    """Return length bytes of the keystream for the chunk with the given
+    index.
+    """
+    seed = encryption_key + nonce + index.to_bytes(8, 'big')
+    return shake_128(seed).digest(length)
+
+def _xor(data: bytes, stream: bytes) -> bytes:
+    """XOR two byte strings of the same length."""
+    if np is not None:
+        return np.bitwise_xor(
+            np.frombuffer(data, np.uint8),
+            np.frombuffer(stream, np.uint8)).tobytes()
+    # Without NumPy, a single big integer XOR still runs in C over the
+    # whole buffer.
+    x = int.from_bytes(data, 'big') ^ int.from_bytes(stream, 'big')
+    return x.to_bytes(len(data), 'big')
+
+def wrap_key(n: int, e: int, session_key: bytes) -> list:
+    """Encrypt the session key with public key (n, e), packing it into as
+    few blocks as n allows.
+    """
+    width = rsacalc.Block_Size(n)
+    if width < 1:
+        raise ValueError('n is too small to wrap a session key')
+    blocks = rsacalc.Pack_Blocks(session_key, width)
+    return [rsacalc.FME(M, e, n) if M else 0 for M in blocks]
+
+def unwrap_key(
+        n: int, d: int, wrapped: list,
+        key: rsacalc.PrivateKey = None) -> bytes:
+    """Decrypt a session key wrapped by wrap_key."""
+    msg_nums = rsacalc._decode_nums(n, d, wrapped, key)
+    return rsacalc.Unpack_Blocks(msg_nums, rsacalc.Block_Size(n))
+
+def _rechunk(chunks: Iterator[bytes], size: int) -> Iterator[bytes]:
+    """Regroup chunks of bytes into pieces of exactly size bytes,
+    followed by one last piece of fewer than size bytes (possibly none).
+    """
+    pending = b''
+    for chunk in chunks:
+        if pending:
+            chunk = pending + chunk
+        # Full pieces are views of the chunk, so they are not copied.
+        view = memoryview(chunk)
+        start = 0
+        while len(chunk) - start >= size:
+            yield view[start:start + size]
+            start += size
+        pending = bytes(view[start:])
+    yield pending
+
+def _record_tag(mac: blake2b, index: int, last: bool,
+                data: bytes) -> bytes:
+    """Return the tag of a record from a MAC that has already taken in
+    the header. The record's position and whether it is the last one are
+    authenticated too, so records cannot be reordered, dropped, or cut
+    off at the end.
+    """
+    mac = mac.copy()
+    mac.update(index.to_bytes(8, 'big') + bytes([last]))
+    mac.update(data)
+    return mac.digest()
+
+def encrypt_chunks(
+        n: int, e: int, chunks: Iterator[bytes]) -> Iterator[bytes]:
+    """Encrypt a message given as chunks of bytes with a new random
+    session key wrapped under public key (n, e), yielding the hybrid
+    cipher text in pieces.
+    """
+    session_key = token_bytes(SESSION_KEY_SIZE)
+    nonce = token_bytes(16)
+    encryption_key, mac_key = _derive_keys(session_key)
+    wrapped = wrap_key(n, e, session_key)
+    width = (n.bit_length() + 7) // 8
+    head = HEADER.pack(MAGIC, VERSION, width, len(wrapped), nonce)
+    head += b''.join(C.to_bytes(width, 'big') for C in wrapped)
+    mac = blake2b(key=mac_key, digest_size=TAG_SIZE)
+    mac.update(head)
+    yield head
+
+    # Encrypt then authenticate each chunk. Only the last piece from
+    # _rechunk is shorter than a full chunk.
+    for index, data in enumerate(_rechunk(chunks, CHUNK_SIZE)):
+        out = _xor(data, _keystream(
+            encryption_key, nonce, index, len(data))) if data else b''
+        yield out
+        yield _record_tag(mac, index, len(data) < CHUNK_SIZE, out)
+
+def _read_at_least(
+        buffer: bytes, chunks: Iterator[bytes], size: int) -> bytes:
+    """Add chunks to the buffer until it holds at least size bytes."""
+    while len(buffer) < size:
+        chunk = next(chunks, b'')
+        if not chunk:
+            raise ValueError('hybrid cipher text is truncated')
+        buffer += chunk
+    return buffer
+
+def decrypt_chunks(
+        n: int, d: int, chunks: Iterator[bytes],
+        key: rsacalc.PrivateKey = None) -> Iterator[bytes]:
+    """Decrypt hybrid cipher text given as chunks of bytes, yielding the
+    message in pieces.
+    Each piece is only yielded once its tag checks out. A ValueError can
+    still be raised after some pieces if the rest of the cipher text is
+    missing or was tampered with, in which case the pieces so far are
+    only the start of the message.
+    """
+    chunks = iter(chunks)
+    buffer = _read_at_least(b'', chunks, HEADER.size)
+    magic, version, width, count, nonce = HEADER.unpack(
+        buffer[:HEADER.size])
+    if magic != MAGIC:
+        raise ValueError('not hybrid cipher text')
+    if version != VERSION:
+        raise ValueError(f'unsupported hybrid format version {version}')
+    head_size = HEADER.size + width * count
+    buffer = _read_at_least(buffer, chunks, head_size)
+
+    view = memoryview(buffer)
+    wrapped = []
+    for start in range(HEADER.size, head_size, width):
+        wrapped.append(int.from_bytes(view[start:start + width], 'big'))
+    session_key = unwrap_key(n, d, wrapped, key)
+    encryption_key, mac_key = _derive_keys(session_key)
+    mac = blake2b(key=mac_key, digest_size=TAG_SIZE)
+    mac.update(buffer[:head_size])
+
+    # Every record but the last holds a full chunk.
+    records = _rechunk(chain([buffer[head_size:]], chunks), RECORD_SIZE)
+    for index, record in enumerate(records):
+        last = len(record) < RECORD_SIZE
+        if len(record) < TAG_SIZE:
+            raise ValueError('hybrid cipher text is truncated')
+        data, tag = record[:-TAG_SIZE], bytes(record[-TAG_SIZE:])
+        if not hmac.compare_digest(
+                _record_tag(mac, index, last, data), tag):
+            raise ValueError('hybrid cipher text failed authentication')
+        if data:
+            yield _xor(data, _keystream(
+                encryption_key, nonce, index, len(data)))
+
+def hybrid_encrypt(n: int, e: int, message: bytes) -> bytes:
+    """Encrypt a message with a session key wrapped under public key
+    (n, e).
+    """
+    return b''.join(encrypt_chunks(n, e, [message]))
+
+def hybrid_decrypt(
+        n: int, d: int, cipher_text: bytes,
+        key: rsacalc.PrivateKey = None) -> bytes:
+    """Decrypt and authenticate cipher text made by hybrid_encrypt."""
+    # Joining the pieces means nothing is returned unless every tag
+    # checks out.
+    return b''.join(decrypt_chunks(n, d, [cipher_text], key))
+
+def is_hybrid_ciphertext(prefix: bytes) -> bool:
+    """Check whether the first bytes of a file mark it as hybrid cipher
+    text.
+    """
+    return prefix[:len(MAGIC)] == MAGIC
+
+def encrypt_file(n: int, e: int, source: BinaryIO, out: BinaryIO) -> None:
+    """Encrypt everything read from source and write it to out."""
+    chunks = iter(lambda: source.read(CHUNK_SIZE), b'')
+    for piece in encrypt_chunks(n, e, chunks):
+        out.write(piece)
+
+def decrypt_file(
+        n: int, d: int, source: BinaryIO, out: BinaryIO,
+        key: rsacalc.PrivateKey = None) -> None:
+    """Decrypt everything read from source and write it to out."""
+    chunks = iter(lambda: source.read(CHUNK_SIZE), b'')
+    for piece in decrypt_chunks(n, d, chunks, key):
+        out.write(piece)
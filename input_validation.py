@@ -14,12 +14,35 @@ def validate_pos_int(prompt: str) -> int:
         except ValueError:
             print('Invalid input, please enter an integer')
 
+def parse_int_list(text: str) -> list:
+    """Parse a list of integers like [321, 654, 987] directly, without
+    building a syntax tree for it. Return None if the text is not in
+    that form.
+    """
+    text = text.strip()
+    if not (text.startswith('[') and text.endswith(']')):
+        return None
+    inner = text[1:-1].strip()
+    if not inner:
+        return []
+    try:
+        return [int(item) for item in inner.rstrip(',').split(',')]
+    except ValueError:
+        return None
+
 def validate_list(prompt: str) -> list:
     """Prompt the user until they enter a list.
     Return the list.
     """
     while True:
         user_input = input(prompt)
+
+        # Lists of integers (like cipher text) are parsed directly, which
+        # is much faster for long lists. Anything else falls back to the
+        # general parser.
+        mylist = parse_int_list(user_input)
+        if mylist is not None:
+            return mylist
         try:
             mylist = literal_eval(user_input)
             if isinstance(mylist, list):
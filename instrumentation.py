@@ -0,0 +1,110 @@
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from functools import wraps
+from time import perf_counter
+from typing import Callable, Iterator
+
+import RSA_calculations as rsacalc
+
+# Functions in RSA_calculations that are counted and timed while profiling.
+# They are only wrapped while a profiler is running, so there is no
+# overhead at all when profiling is off.
+INSTRUMENTED = (
+    'FME', 'Euclidean_Alg', 'EEA', 'CRT_Decode', 'Find_Public_Key_e',
+    'Find_Private_Key_d', 'Build_Private_Key', 'generate_prime',
+    'Encode', 'Decode', 'Encode_Array', 'Decode_Array',
+    'find_factor', 'find_factor_parallel', 'codebook_attack',
+    'break_code_report',
+    )
+
+# Upper edges (in seconds) of the call duration histogram buckets. The
+# last bucket holds every slower call.
+BUCKETS = (1e-6, 1e-5, 1e-4, 1e-3, 1e-2, 1e-1, 1.0, 10.0)
+
+
+class Profiler:
+    """Per-function call counts, cumulative wall time, and duration
+    histograms for the functions in INSTRUMENTED, plus the operation
+    counters reported by RSA_calculations (gcd steps, factoring
+    candidates tried, and so on).
+    Calls made inside worker processes are not included.
+    """
+
+    def __init__(self) -> None:
+        self.calls = Counter()
+        self.seconds = defaultdict(float)
+        self.histograms = defaultdict(lambda: [0] * (len(BUCKETS) + 1))
+        self.counters = Counter()
+        self._originals = {}
+
+    def count(self, name: str, k: int = 1) -> None:
+        """Add k to the operation counter with the given name."""
+        self.counters[name] += k
+
+    def _wrap(self, name: str, func: Callable) -> Callable:
+        """Return a version of func that records its calls."""
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = perf_counter() - start
+                self.calls[name] += 1
+                self.seconds[name] += elapsed
+                self.histograms[name][bisect_left(BUCKETS, elapsed)] += 1
+        return wrapper
+
+    def start(self) -> None:
+        """Start recording by wrapping the instrumented functions."""
+        if self._originals:
+            return
+        for name in INSTRUMENTED:
+            func = getattr(rsacalc, name)
+            self._originals[name] = func
+            setattr(rsacalc, name, self._wrap(name, func))
+        rsacalc.PROFILER = self
+
+    def stop(self) -> None:
+        """Stop recording and restore the original functions."""
+        for name, func in self._originals.items():
+            setattr(rsacalc, name, func)
+        self._originals = {}
+        if rsacalc.PROFILER is self:
+            rsacalc.PROFILER = None
+
+    def report(self) -> str:
+        """Return the recorded statistics as a table."""
+        lines = [f'{"function":22} {"calls":>9} {"total ms":>11} '
+                 f'{"mean us":>10}  histogram (<=1us ... >10s)']
+        for name in sorted(self.calls, key=self.seconds.get, reverse=True):
+            calls, seconds = self.calls[name], self.seconds[name]
+            histogram = ' '.join(str(k) for k in self.histograms[name])
+            lines.append(f'{name:22} {calls:9} {seconds * 1e3:11.3f} '
+                         f'{seconds / calls * 1e6:10.1f}  {histogram}')
+        if self.counters:
+            lines.append('')
+            lines.append(f'{"operation":22} {"count":>9}')
+            for name, k in sorted(self.counters.items()):
+                lines.append(f'{name:22} {k:9}')
+        return '\n'.join(lines)
+
+    def __enter__(self) -> 'Profiler':
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+@contextmanager
+def profiling() -> Iterator[Profiler]:
+    """Profile the RSA calculations made inside the with block.
+    Example:
+        with profiling() as profiler:
+            Decode(n, d, C)
+        print(profiler.report())
+    """
+    profiler = Profiler()
+    with profiler:
+        yield profiler
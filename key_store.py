@@ -0,0 +1,222 @@
+import json
+import os
+from collections import OrderedDict
+from hashlib import sha256
+from typing import List, NamedTuple, Tuple
+
+import RSA_calculations as rsacalc
+
+# Directory where key pairs are saved, unless the RSA_KEY_STORE environment
+# variable names another one.
+DEFAULT_PATH = os.path.join(os.path.expanduser('~'), '.rsa_keys')
+
+# Number of loaded keys kept in memory.
+DEFAULT_CACHE_SIZE = 16
+
+
+class StoredKey(NamedTuple):
+    """A saved key pair with every value that decoding needs already
+    computed: the CRT private key, the sliding window steps for the
+    exponents d, dP, and dQ, and the Montgomery constants for n, p, and
+    q.
+    """
+    key_id: str
+    n: int
+    e: int
+    d: int
+    p: int
+    q: int
+    private_key: rsacalc.PrivateKey
+    window_steps: dict
+    montgomery: dict
+
+class KeyStore:
+    """Key pairs saved as one JSON file each in a directory, plus an
+    index of their public keys.
+    The index is read the first time it is needed, a key file is only
+    read when that key is used, and the most recently used keys are kept
+    in memory.
+    """
+
+    def __init__(
+            self, path: str = None,
+            cache_size: int = DEFAULT_CACHE_SIZE) -> None:
+        if path is None:
+            path = os.environ.get('RSA_KEY_STORE', DEFAULT_PATH)
+        self.path = path
+        self.cache_size = cache_size
+        self._index = None
+        self._cache = OrderedDict()
+
+    def _index_path(self) -> str:
+        return os.path.join(self.path, 'index.json')
+
+    def _key_path(self, key_id: str) -> str:
+        return os.path.join(self.path, f'{key_id}.json')
+
+    def index(self) -> dict:
+        """Return a dict from key ID to public key [n, e] for every saved
+        key.
+        """
+        if self._index is None:
+            try:
+                with open(self._index_path()) as f:
+                    self._index = json.load(f)
+            except FileNotFoundError:
+                self._index = {}
+        return self._index
+
+    def list_keys(self) -> List[Tuple[str, int, int]]:
+        """Return (key ID, n, e) for every saved key."""
+        keys = []
+        for key_id, (n, e) in self.index().items():
+            keys.append((key_id, n, e))
+        return keys
+
+    def save(self, n: int, e: int, d: int, p: int, q: int) -> str:
+        """Precompute the decoding values for a key pair, save it, and
+        return its key ID.
+        """
+        key_id = sha256(n.to_bytes((n.bit_length() + 7) // 8, 'big'))
+        key_id = key_id.hexdigest()[:16]
+        private_key = rsacalc.Build_Private_Key(d, p, q)
+        window_steps = {}
+        for name, exponent in (('d', d), ('dP', private_key.dP),
+                               ('dQ', private_key.dQ)):
+            window_steps[name] = rsacalc._window_recode(
+                exponent, rsacalc._window_size(exponent.bit_length()))
+        montgomery = {}
+        for name, m in (('n', n), ('p', p), ('q', q)):
+            if m % 2 == 1:
+                k, mask, m_prime = rsacalc._montgomery_constants(m)
+                montgomery[name] = [k, m_prime]
+        record = {
+            'n': n, 'e': e, 'd': d, 'p': p, 'q': q,
+            'dP': private_key.dP, 'dQ': private_key.dQ,
+            'qInv': private_key.qInv,
+            'window_steps': window_steps,
+            'montgomery': montgomery,
+            }
+
+        # Write the key file before adding it to the index, each through
+        # a temporary file, so an interrupted save never leaves a broken
+        # index behind. Only the owner may read the private keys.
+        os.makedirs(self.path, mode=0o700, exist_ok=True)
+        _write_json(self._key_path(key_id), record)
+        self.index()[key_id] = [n, e]
+        _write_json(self._index_path(), self.index())
+        return key_id
+
+    def load(self, key_id: str) -> StoredKey:
+        """Return the saved key with the given ID, reading it from disk
+        only if it is not already in memory.
+        """
+        stored = self._cache.get(key_id)
+        if stored is not None:
+            self._cache.move_to_end(key_id)
+            return stored
+        if key_id not in self.index():
+            raise KeyError(f'no stored key {key_id}')
+        with open(self._key_path(key_id)) as f:
+            record = json.load(f)
+
+        # Rebuild the precomputed values exactly as they were saved.
+        private_key = rsacalc.PrivateKey(
+            record['n'], record['d'], record['p'], record['q'],
+            record['dP'], record['dQ'], record['qInv'])
+        window_steps = {}
+        for name, steps in record['window_steps'].items():
+            window_steps[name] = [tuple(step) for step in steps]
+        montgomery = {}
+        for name, (k, m_prime) in record['montgomery'].items():
+            montgomery[name] = (k, (1 << k) - 1, m_prime)
+        stored = StoredKey(
+            key_id, record['n'], record['e'], record['d'], record['p'],
+            record['q'], private_key, window_steps, montgomery)
+
+        self._cache[key_id] = stored
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return stored
+
+    def find(self, n: int) -> StoredKey:
+        """Return the saved key with modulus n, or None if there is none.
+        """
+        for key_id, (stored_n, e) in self.index().items():
+            if stored_n == n:
+                return self.load(key_id)
+        return None
+
+def _write_json(path: str, data) -> None:
+    """Write data as JSON to path, replacing any existing file at once.
+    The file can only be read and written by its owner.
+    """
+    temporary = f'{path}.tmp'
+    flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC
+    with open(os.open(temporary, flags, 0o600), 'w') as f:
+        # A leftover temporary file keeps its old mode, so set it again.
+        os.fchmod(f.fileno(), 0o600)
+        json.dump(data, f)
+    os.replace(temporary, path)
+
+def _power_function(stored: StoredKey, exponent: str, modulus: str):
+    """Return a function computing C^exponent mod modulus for one of the
+    stored key's (exponent, modulus) pairs, using its precomputed window
+    steps or Montgomery constants when FME is set to a backend that
+    needs them.
+    """
+    e = {'d': stored.d, 'dP': stored.private_key.dP,
+         'dQ': stored.private_key.dQ}[exponent]
+    m = {'n': stored.n, 'p': stored.p, 'q': stored.q}[modulus]
+    backend = rsacalc.FME_BACKEND
+    if backend == 'python':
+        backend = rsacalc.select_FME_backend(e, m)
+    if backend == 'window':
+        steps = stored.window_steps[exponent]
+        power = lambda C: rsacalc._FME_window(C, e, m, steps)
+    elif backend == 'montgomery' and modulus in stored.montgomery:
+        constants = stored.montgomery[modulus]
+        power = lambda C: rsacalc._FME_montgomery(C, e, m, constants)
+    else:
+        power = lambda C: rsacalc.FME(C, e, m)
+
+    def reduced_power(C: int) -> int:
+        # C and the exponent may be 0 after being reduced by the prime
+        # modulus m or by m - 1.
+        C %= m
+        if C == 0:
+            return 0
+        if e == 0:
+            return 1
+        return power(C)
+    return reduced_power
+
+def decode(stored: StoredKey, cipher_text: list, block: bool = False) -> str:
+    """Decode numeric cipher text with a stored key, using the Chinese
+    Remainder Theorem with all of its setup already done.
+    """
+    key = stored.private_key
+    power_p = _power_function(stored, 'dP', 'p')
+    power_q = _power_function(stored, 'dQ', 'q')
+
+    def power(C: int) -> int:
+        m1 = power_p(C)
+        m2 = power_q(C)
+        h = key.qInv * (m1 - m2) % key.p
+        return m2 + h * key.q
+
+    if block:
+        msg_nums = [power(C) for C in cipher_text]
+        width = rsacalc.Block_Size(stored.n)
+        return rsacalc.Unpack_Blocks(msg_nums, width).decode('utf-8')
+    if stored.n < rsacalc.CODEBOOK_MAX_N:
+        # Repeated ciphers are looked up instead of recomputed, as in
+        # rsacalc.Decode.
+        msg_nums = rsacalc.CODEBOOK.power_all(
+            stored.n, stored.d, cipher_text, power, rsacalc.CODE_POINT_TYPE)
+    else:
+        msg_nums = map(power, cipher_text)
+    return rsacalc.Convert_Num(msg_nums)
+
+# The key store used by the interactive menu.
+STORE = KeyStore()
@@ -1,4 +1,8 @@
+import sys
+
+import cli
 import menu_options as menu
+from instrumentation import Profiler
 from print_only import welcome, main_menu
 
 def main():
@@ -9,6 +13,8 @@ def main():
     # program in order.
     p, q, n, e, d = 0, 0, 0, 0, 0 
     C = []
+    # Profiling is toggled by the hidden menu option 'p'.
+    profiler = None
     # Ensure the menu will display before there is any user input.
     direction = 'menu'
     while True:
@@ -33,10 +39,27 @@ def main():
         elif menu_choice == '3':
             C, direction = menu.encode_option(n, e)
         elif menu_choice == '4':
-            direction = menu.decode_option(n, d, C)
+            direction = menu.decode_option(n, d, C, p, q)
         elif menu_choice == '5':
             direction = menu.break_codes_option(n, e, C)
+        elif menu_choice == 'p':
+            # Hidden option: turn profiling of the RSA calculations on,
+            # or turn it off and print what was recorded.
+            print()
+            if profiler is None:
+                profiler = Profiler()
+                profiler.start()
+                print('Profiling is on. Enter p again to see the report.')
+            else:
+                profiler.stop()
+                print(profiler.report())
+                profiler = None
+            direction = 'menu'
         elif menu_choice == '0':
+            if profiler is not None:
+                profiler.stop()
+                print()
+                print(profiler.report())
             print()
             print('Goodbye for now!')
             print()
@@ -45,4 +68,9 @@ def main():
             print('Invalid response, please select one of the options')
 
 if __name__ == "__main__":
-    main()
+    # Any command line arguments select a non-interactive subcommand
+    # (see cli.py) instead of the menu.
+    if len(sys.argv) > 1:
+        cli.run(sys.argv[1:])
+    else:
+        main()
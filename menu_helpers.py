@@ -1,6 +1,7 @@
 from typing import Tuple
 
 from input_validation import validate_pos_int, validate_list
+from key_store import STORE, StoredKey
 
 
 def old_or_new_ints(
@@ -8,10 +9,15 @@ def old_or_new_ints(
         old_values: Tuple[int, int]) -> Tuple[int, int]:
     """Arguments for val_names (strings) and old_values (integers) must
     be tuples of the same length and order.
-    Prompt the user to use the preexisting values or input new ones.
+    Prompt the user to use the preexisting values, input new ones, or
+    take them from a key pair in the key store.
     Return the appropriate values as a tuple.
     """
 
+    # Stored keys can only be offered if they have all of the values.
+    use_store = (all(name in StoredKey._fields for name in val_names)
+                 and len(STORE.index()) > 0)
+
     # It is only necessary to ask the user if they want to use the
     # previous values if there are previous values available.
     valid_values = True
@@ -27,14 +33,32 @@ def old_or_new_ints(
         print((f'You previously generated the values {old_values} for '
                f'{val_names_str}. Would you like to use these values or '
                'enter new ones?'))
+        if use_store:
+            prompt = ('Enter 1 to use the old values, 2 to enter new ones, '
+                      '3 to use a stored key: ')
+        else:
+            prompt = 'Enter 1 to use the old values, 2 to enter new ones: '
         while True:
-            user_response = input(('Enter 1 to use the old values, '
-                                   '2 to enter new ones: '))
+            user_response = input(prompt)
             if user_response == '1':
                 return old_values
             elif user_response == '2':
                 need_new = True
                 break
+            elif user_response == '3' and use_store:
+                return stored_key_values(val_names)
+            else:
+                print('Invalid response, please select one of the options')
+    elif use_store:
+        print('Would you like to enter new values or use a stored key?')
+        while True:
+            user_response = input(('Enter 1 to enter new values, '
+                                   '2 to use a stored key: '))
+            if user_response == '1':
+                need_new = True
+                break
+            elif user_response == '2':
+                return stored_key_values(val_names)
             else:
                 print('Invalid response, please select one of the options')
     else:
@@ -50,6 +74,28 @@ def old_or_new_ints(
         new_val_tuple = tuple(new_val_list)
         return new_val_tuple
 
+def stored_key_values(val_names: Tuple[str, str]) -> Tuple[int, int]:
+    """List the key pairs in the key store and prompt the user to pick
+    one.
+    Return the picked key's values for val_names as a tuple.
+    """
+    keys = STORE.list_keys()
+    print()
+    for i, (key_id, n, e) in enumerate(keys, 1):
+        n_str = str(n)
+        if len(n_str) > 20:
+            n_str = f'{n_str[:8]}...{n_str[-8:]} ({len(n_str)} digits)'
+        print(f'{i} - key {key_id}: n = {n_str}, e = {e}')
+    while True:
+        choice = validate_pos_int('Enter the number of the key to use: ')
+        if choice <= len(keys):
+            break
+        print('Invalid response, please select one of the options')
+
+    # Loading the key also brings its precomputed values into memory.
+    stored = STORE.load(keys[choice - 1][0])
+    return tuple(getattr(stored, name) for name in val_names)
+
 def old_or_new_list(list_name: str, old_list: list) -> list:
     """Prompt the user to use the preexisting list or input a new one.
     Return the appropriate list accordingly.
@@ -0,0 +1,280 @@
+import mmap
+import os
+import struct
+from math import isqrt
+from typing import Iterator
+
+# fcntl is only available on Unix: without it, processes extending the
+# same sieve file at once may briefly record fewer segments than were
+# saved, which only means some segments get sieved again.
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# The sieve file starts with a header:
+#   magic (4 bytes), format version (1 byte), segment size in bytes
+#   (4 bytes), number of segments sieved so far (8 bytes),
+# all big-endian, followed by the segments. Bit j (from the least
+# significant) of byte k says whether the odd number 2(8k + j) + 1 is
+# prime, so each byte covers 16 numbers.
+MAGIC = b'PSIV'
+VERSION = 1
+HEADER = struct.Struct('>4sBIQ')
+
+SEGMENT_BYTES = 1 << 16
+SEGMENT_NUMBERS = SEGMENT_BYTES * 16
+
+# File where the sieve is kept, unless the RSA_PRIME_SIEVE environment
+# variable names another one.
+DEFAULT_PATH = os.path.join(os.path.expanduser('~'), '.rsa_primes')
+
+# Largest limit the sieve will grow to (a 256 MiB file). Bigger numbers
+# should be tested with RSA_calculations.is_probable_prime instead.
+MAX_LIMIT = 1 << 32
+
+# For each bit position, a translation table turning a 0/1 flag byte
+# into that bit, so that 8 flag bytes can be packed into one byte with
+# a few operations on whole segments.
+_BIT_TABLES = [bytes([0, 1 << j]) + bytes(254) for j in range(8)]
+
+# For each byte value, the positions of its set bits.
+_SET_BITS = [tuple(j for j in range(8) if value >> j & 1)
+             for value in range(256)]
+
+
+class PrimeSieve:
+    """A sieve of Eratosthenes over the odd numbers, stored as a bitset
+    in a file that is memory mapped, so opening it costs nothing and
+    only the parts that are used are read from disk.
+    The sieve grows one segment at a time as queries need larger
+    numbers, and every segment sieved is saved for later runs. If the
+    file cannot be written, the sieve is kept in memory instead.
+    """
+
+    def __init__(self, path: str = None) -> None:
+        if path is None:
+            path = os.environ.get('RSA_PRIME_SIEVE', DEFAULT_PATH)
+        self.path = path
+        self._file = None
+        self._data = None
+        self._segments = 0
+        self._pid = None
+
+    @property
+    def limit(self) -> int:
+        """Every number below the limit has been sieved."""
+        self._open()
+        return self._segments * SEGMENT_NUMBERS
+
+    def _open(self) -> None:
+        """Map the sieve file, creating it if it does not exist yet.
+        If the file cannot be used (it cannot be created or opened for
+        writing, or it is not a prime sieve file), keep the sieve in
+        memory instead, leaving the file alone.
+        """
+        if self._data is not None:
+            if self._file is None or self._pid == os.getpid():
+                return
+            # A forked process opens the file again, so that it has a
+            # file description of its own instead of the one it shares
+            # with its parent.
+            self.close()
+        self._pid = os.getpid()
+        try:
+            self._file = _open_sieve_file(self.path)
+        except OSError:
+            self._file = None
+        if self._file is None:
+            self._data = bytearray()
+            return
+        self._remap(self._saved_segments())
+
+    def _saved_segments(self) -> int:
+        """Return the number of segments the file header records."""
+        header = os.pread(self._file.fileno(), HEADER.size, 0)
+        return HEADER.unpack(header)[3]
+
+    def _record_segments(self, segments: int) -> None:
+        """Record in the file header that the given number of segments
+        are saved, unless the header already records more.
+        """
+        fd = self._file.fileno()
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            if segments > self._saved_segments():
+                os.pwrite(fd, HEADER.pack(
+                    MAGIC, VERSION, SEGMENT_BYTES, segments), 0)
+        finally:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def _remap(self, segments: int) -> None:
+        """Map the header and the given number of segments of the file."""
+        # Only trust segments that are completely written.
+        size = os.fstat(self._file.fileno()).st_size
+        segments = min(segments, (size - HEADER.size) // SEGMENT_BYTES)
+        self._segments = segments
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        if segments:
+            self._data = mmap.mmap(
+                self._file.fileno(), HEADER.size + segments * SEGMENT_BYTES,
+                access=mmap.ACCESS_READ)
+        else:
+            self._data = b''
+
+    def _byte(self, k: int) -> int:
+        """Return byte k of the bitset."""
+        if self._file is None:
+            return self._data[k]
+        return self._data[HEADER.size + k]
+
+    def _bytes(self, start: int, end: int) -> bytes:
+        """Return bytes start to end of the bitset."""
+        if self._file is None:
+            return bytes(self._data[start:end])
+        return self._data[HEADER.size + start:HEADER.size + end]
+
+    def extend(self, limit: int) -> None:
+        """Sieve segments until every number below limit is covered."""
+        if limit > MAX_LIMIT:
+            raise ValueError(f'the prime sieve only goes up to {MAX_LIMIT}')
+        self._open()
+        while self._segments * SEGMENT_NUMBERS < limit:
+            if self._file is not None:
+                # Use any segments another process has saved meanwhile.
+                segments = self._segments
+                self._remap(self._saved_segments())
+                if self._segments > segments:
+                    continue
+            segment = self._sieve_segment(self._segments)
+            if self._file is None:
+                self._data += segment
+                self._segments += 1
+                continue
+
+            # Each segment has a fixed place in the file, so processes
+            # sieving at the same time write the same bytes there. pwrite
+            # does not use the file offset, which forked processes
+            # share.
+            os.pwrite(self._file.fileno(), segment,
+                      HEADER.size + self._segments * SEGMENT_BYTES)
+            self._record_segments(self._segments + 1)
+            self._remap(self._segments + 1)
+
+    def _sieve_segment(self, k: int) -> bytes:
+        """Sieve segment k and return it packed into bits."""
+        low = k * SEGMENT_NUMBERS
+        high = low + SEGMENT_NUMBERS
+        count = SEGMENT_BYTES * 8
+
+        # One flag byte per odd number low + 2i + 1, for fast slice
+        # assignment.
+        flags = bytearray(b'\x01') * count
+        if k == 0:
+            # The first segment is sieved by its own primes as they are
+            # found; every later one by the primes already saved.
+            flags[0] = 0
+            base = (p for p in range(3, isqrt(high) + 1, 2)
+                    if flags[p // 2])
+        else:
+            base = self.primes(3, isqrt(high))
+        for p in base:
+            # Start from the first odd multiple of p in the segment, but
+            # not below p^2, since smaller multiples have smaller prime
+            # factors. Consecutive odd multiples are p flags apart.
+            m = max(p * p, (low + p - 1) // p * p)
+            if m % 2 == 0:
+                m += p
+            i = (m - low) // 2
+            flags[i::p] = bytes(len(range(i, count, p)))
+
+        packed = 0
+        for j in range(8):
+            packed |= int.from_bytes(
+                flags[j::8].translate(_BIT_TABLES[j]), 'little')
+        return packed.to_bytes(SEGMENT_BYTES, 'little')
+
+    def is_prime(self, n: int) -> bool:
+        """Check whether n is prime."""
+        if n < 3:
+            return n == 2
+        if n % 2 == 0:
+            return False
+        if n >= self.limit:
+            self.extend(n + 1)
+        i = n // 2
+        return bool(self._byte(i >> 3) >> (i & 7) & 1)
+
+    def next_prime(self, x: int) -> int:
+        """Return the smallest prime greater than or equal to x."""
+        if x <= 2:
+            return 2
+        for p in self.primes(x, MAX_LIMIT - 1):
+            return p
+        raise ValueError(f'no prime below {MAX_LIMIT} is at least {x}')
+
+    def primes(self, a: int, b: int) -> Iterator[int]:
+        """Yield every prime p with a <= p <= b in increasing order,
+        sieving further as needed.
+        """
+        if a <= 2 <= b:
+            yield 2
+        start = max(a, 3) // 2
+        end = (b - 1) // 2 + 1
+        i = start
+        while i < end:
+            if i * 2 >= self.limit:
+                self.extend(min(i * 2 + SEGMENT_NUMBERS, end * 2))
+
+            # Work through whole bytes of the bitset up to the end of
+            # what has been sieved so far.
+            last = min(end, self.limit // 2)
+            base = i >> 3 << 3
+            for value in self._bytes(i >> 3, (last + 7) >> 3):
+                if value:
+                    for j in _SET_BITS[value]:
+                        if i <= base + j < last:
+                            yield 2 * (base + j) + 1
+                base += 8
+            i = last
+
+    def close(self) -> None:
+        """Unmap and close the sieve file."""
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        if self._file is not None:
+            self._file.close()
+        self._file = None
+        self._data = None
+
+def _open_sieve_file(path: str):
+    """Open the sieve file at path for reading and writing, creating it
+    with an empty header if it does not exist.
+    Return None if the file exists but does not start with a complete
+    header for this format.
+    """
+    # Only the process that creates the file writes its first header, so
+    # an existing file is never truncated under another process that has
+    # already sieved into it.
+    try:
+        fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o644)
+    except FileExistsError:
+        fd = os.open(path, os.O_RDWR)
+    else:
+        os.write(fd, HEADER.pack(MAGIC, VERSION, SEGMENT_BYTES, 0))
+    f = open(fd, 'r+b')
+    f.seek(0)
+    header = f.read(HEADER.size)
+    if (len(header) < HEADER.size
+            or HEADER.unpack(header)[:3] != (MAGIC, VERSION, SEGMENT_BYTES)):
+        f.close()
+        return None
+    f.seek(0)
+    return f
+
+# The sieve used by RSA_calculations. Nothing is read or sieved until it
+# is first queried.
+SIEVE = PrimeSieve()
@@ -0,0 +1,363 @@
+import asyncio
+import json
+import os
+import socket
+import struct
+from argparse import ArgumentParser
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+from typing import List, Tuple
+
+import RSA_calculations as rsacalc
+
+# Every request and response is one frame: a header with the length of
+# the payload, the operation (in a request) or status (in a response),
+# and a request ID chosen by the client, all big-endian, followed by the
+# payload, a JSON object in UTF-8. Responses carry the ID of their
+# request and may arrive in any order.
+FRAME = struct.Struct('>IBI')
+MAX_PAYLOAD = 64 << 20
+
+OPS = {1: 'keygen', 2: 'encrypt', 3: 'decrypt', 4: 'break', 5: 'stats'}
+OP_CODES = {name: code for code, name in OPS.items()}
+STATUS_OK = 0
+STATUS_ERROR = 1
+
+DEFAULT_PORT = 8765
+
+# Requests accepted but not yet answered, across all connections. Once
+# this many are pending, the service stops reading new requests, so
+# clients that send faster than it can work are slowed down by their
+# sockets filling up instead of by memory filling up here.
+DEFAULT_MAX_PENDING = 256
+
+# Encrypt and decrypt requests of at most this many characters or
+# ciphers are small enough to be sent to the workers in batches.
+SMALL_REQUEST = 256
+
+# A batch is sent once it has this many requests, or once its first
+# request has waited this many seconds.
+BATCH_SIZE = 64
+BATCH_DELAY = 0.002
+
+# Number of recent latencies kept for each operation.
+LATENCY_WINDOW = 10000
+
+
+def _private_key(body: dict):
+    """Build the CRT private key from the primes in a request, if it has
+    them.
+    """
+    primes = body.get('primes')
+    if not primes:
+        return None
+    return rsacalc.Build_Private_Key(body['d'], *primes)
+
+def handle_request(op: str, body: dict) -> dict:
+    """Carry out one request in a worker process and return its result."""
+    if op == 'keygen':
+        primes = rsacalc.generate_key_primes(
+            body.get('bits', 1024), body.get('primes', 2))
+        n, e = rsacalc.Find_Public_Key_e(*primes)
+        d = rsacalc.Find_Private_Key_d(e, *primes)
+        return {'n': n, 'e': e, 'd': d, 'primes': list(primes)}
+    if op == 'encrypt':
+        C = rsacalc.Encode(
+            body['n'], body['e'], body['message'], body.get('block', False))
+        return {'cipher_text': list(C)}
+    if op == 'decrypt':
+        M = rsacalc.Decode(
+            body['n'], body['d'], body['cipher_text'], _private_key(body),
+            body.get('block', False))
+        return {'message': M}
+    if op == 'break':
+        M, result = rsacalc.break_code_report(
+            body['n'], body['e'], body['cipher_text'],
+            body.get('block', False))
+        return {'message': M, 'method': result.method,
+                'seconds': result.seconds}
+    raise ValueError(f'unknown operation {op}')
+
+def handle_batch(
+        requests: List[Tuple[str, dict]]) -> List[Tuple[int, dict]]:
+    """Carry out a batch of requests in a worker process and return the
+    status and result of each.
+    """
+    responses = []
+    for op, body in requests:
+        try:
+            responses.append((STATUS_OK, handle_request(op, body)))
+        except KeyError as exc:
+            responses.append(
+                (STATUS_ERROR, {'error': f'missing request field {exc}'}))
+        except Exception as exc:
+            responses.append((STATUS_ERROR, {'error': str(exc)}))
+    return responses
+
+class LatencyTracker:
+    """Recent request latencies for each operation, with percentiles."""
+
+    def __init__(self, window: int = LATENCY_WINDOW) -> None:
+        self._samples = defaultdict(lambda: deque(maxlen=window))
+        self._counts = defaultdict(int)
+
+    def record(self, op: str, seconds: float) -> None:
+        self._samples[op].append(seconds)
+        self._counts[op] += 1
+
+    def percentiles(self) -> dict:
+        """Return the request count and the 50th, 90th, and 99th
+        percentile and maximum latencies in milliseconds for each
+        operation.
+        """
+        stats = {}
+        for op, samples in self._samples.items():
+            ordered = sorted(samples)
+            stats[op] = {'count': self._counts[op]}
+            for name, fraction in (('p50', 0.5), ('p90', 0.9),
+                                   ('p99', 0.99)):
+                i = min(int(fraction * len(ordered)), len(ordered) - 1)
+                stats[op][name] = ordered[i] * 1e3
+            stats[op]['max'] = ordered[-1] * 1e3
+        return stats
+
+class RSAService:
+    """An asyncio server for RSA requests, with the calculations done by
+    a pool of worker processes (one per CPU if workers is 0).
+    """
+
+    def __init__(
+            self, workers: int = 0,
+            max_pending: int = DEFAULT_MAX_PENDING) -> None:
+        self.pool = ProcessPoolExecutor(workers or os.cpu_count() or 1)
+        self.latency = LatencyTracker()
+        self._pending = asyncio.Semaphore(max_pending)
+        self._batch_queue = asyncio.Queue()
+        self._batcher = None
+
+    async def start_unix(self, path: str) -> asyncio.AbstractServer:
+        """Start listening on a Unix socket."""
+        self._start_batcher()
+        return await asyncio.start_unix_server(self._serve_connection, path)
+
+    async def start_tcp(
+            self, host: str = '127.0.0.1',
+            port: int = DEFAULT_PORT) -> asyncio.AbstractServer:
+        """Start listening on a TCP port."""
+        self._start_batcher()
+        return await asyncio.start_server(
+            self._serve_connection, host, port)
+
+    def _start_batcher(self) -> None:
+        if self._batcher is None:
+            self._batcher = asyncio.create_task(self._run_batches())
+
+    def close(self) -> None:
+        """Stop batching and shut down the worker processes."""
+        if self._batcher is not None:
+            self._batcher.cancel()
+        self.pool.shutdown(cancel_futures=True)
+
+    async def _serve_connection(
+            self, reader: asyncio.StreamReader,
+            writer: asyncio.StreamWriter) -> None:
+        """Read requests from one client until it disconnects, answering
+        each one as soon as it is done.
+        """
+        lock = asyncio.Lock()
+        tasks = set()
+        try:
+            while True:
+                # Wait for room before reading, so a busy service pushes
+                # back on its clients.
+                await self._pending.acquire()
+                try:
+                    header = await reader.readexactly(FRAME.size)
+                    length, code, request_id = FRAME.unpack(header)
+                    if length > MAX_PAYLOAD:
+                        raise ValueError('request is too large')
+                    payload = await reader.readexactly(length)
+                except (asyncio.IncompleteReadError, ConnectionError,
+                        ValueError):
+                    self._pending.release()
+                    break
+                task = asyncio.create_task(self._answer(
+                    writer, lock, code, request_id, payload))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.wait(tasks)
+        finally:
+            writer.close()
+
+    async def _answer(
+            self, writer: asyncio.StreamWriter, lock: asyncio.Lock,
+            code: int, request_id: int, payload: bytes) -> None:
+        """Carry out one request and write its response."""
+        start = perf_counter()
+        op = OPS.get(code, 'unknown')
+        try:
+            body = json.loads(payload) if payload else {}
+            if op == 'unknown':
+                raise ValueError(f'unknown operation code {code}')
+            if op == 'stats':
+                status, result = STATUS_OK, self.latency.percentiles()
+            else:
+                status, result = await self.submit(op, body)
+        except Exception as exc:
+            status, result = STATUS_ERROR, {'error': str(exc)}
+        try:
+            data = json.dumps(result).encode('utf-8')
+            async with lock:
+                writer.write(FRAME.pack(len(data), status, request_id) + data)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.latency.record(op, perf_counter() - start)
+            self._pending.release()
+
+    async def submit(self, op: str, body: dict) -> Tuple[int, dict]:
+        """Carry out a request in the worker pool, batching it with other
+        small requests, and return its status and result.
+        """
+        if _is_small(op, body):
+            future = asyncio.get_running_loop().create_future()
+            await self._batch_queue.put((op, body, future))
+            return await future
+        loop = asyncio.get_running_loop()
+        responses = await loop.run_in_executor(
+            self.pool, handle_batch, [(op, body)])
+        return responses[0]
+
+    async def _run_batches(self) -> None:
+        """Collect small requests into batches and send each batch to the
+        worker pool as a single job.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._batch_queue.get()]
+            deadline = loop.time() + BATCH_DELAY
+            while len(batch) < BATCH_SIZE:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(
+                        self._batch_queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            job = loop.run_in_executor(
+                self.pool, handle_batch,
+                [(op, body) for op, body, future in batch])
+            job.add_done_callback(
+                lambda job, batch=batch: _finish_batch(job, batch))
+
+def _is_small(op: str, body: dict) -> bool:
+    """Check whether a request is small enough to be batched."""
+    if op == 'encrypt':
+        return len(body.get('message', '')) <= SMALL_REQUEST
+    if op == 'decrypt':
+        return len(body.get('cipher_text', ())) <= SMALL_REQUEST
+    return False
+
+def _finish_batch(job: asyncio.Future, batch: list) -> None:
+    """Hand the results of a finished batch to the requests in it."""
+    if job.exception() is not None:
+        results = [(STATUS_ERROR, {'error': str(job.exception())})] * len(
+            batch)
+    else:
+        results = job.result()
+    for (op, body, future), result in zip(batch, results):
+        if not future.done():
+            future.set_result(result)
+
+class ServiceClient:
+    """A blocking client for the service, sending one request at a time
+    over a Unix socket (if path is given) or TCP.
+    """
+
+    def __init__(
+            self, path: str = None, host: str = '127.0.0.1',
+            port: int = DEFAULT_PORT) -> None:
+        if path is not None:
+            self._socket = socket.socket(socket.AF_UNIX)
+            self._socket.connect(path)
+        else:
+            self._socket = socket.create_connection((host, port))
+        self._file = self._socket.makefile('rb')
+        self._next_id = 0
+
+    def call(self, op: str, **body) -> dict:
+        """Send a request and return its result.
+        Raise a RuntimeError with the service's message if it failed.
+        """
+        self._next_id += 1
+        data = json.dumps(body).encode('utf-8')
+        self._socket.sendall(
+            FRAME.pack(len(data), OP_CODES[op], self._next_id) + data)
+        header = self._file.read(FRAME.size)
+        if len(header) < FRAME.size:
+            raise ConnectionError('service closed the connection')
+        length, status, request_id = FRAME.unpack(header)
+        result = json.loads(self._file.read(length))
+        if status != STATUS_OK:
+            raise RuntimeError(result['error'])
+        return result
+
+    def close(self) -> None:
+        self._file.close()
+        self._socket.close()
+
+    def __enter__(self) -> 'ServiceClient':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+async def serve(
+        path: str = None, host: str = '127.0.0.1',
+        port: int = DEFAULT_PORT, workers: int = 0,
+        max_pending: int = DEFAULT_MAX_PENDING) -> None:
+    """Run the service until it is cancelled, on a Unix socket if path is
+    given and on TCP otherwise.
+    """
+    service = RSAService(workers, max_pending)
+    try:
+        if path is not None:
+            server = await service.start_unix(path)
+        else:
+            server = await service.start_tcp(host, port)
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.close()
+        if path is not None and os.path.exists(path):
+            os.remove(path)
+        print(json.dumps(service.latency.percentiles(), indent=2))
+
+def main() -> None:
+    parser = ArgumentParser(
+        description='Serve RSA requests over a Unix socket or TCP.')
+    parser.add_argument('--unix', help='listen on this Unix socket path')
+    parser.add_argument(
+        '--host', default='127.0.0.1', help='TCP host (default localhost)')
+    parser.add_argument(
+        '--port', type=int, default=DEFAULT_PORT, help='TCP port')
+    parser.add_argument(
+        '--workers', type=int, default=0,
+        help='worker processes (default one per CPU)')
+    parser.add_argument(
+        '--max-pending', type=int, default=DEFAULT_MAX_PENDING,
+        help='requests accepted before the service stops reading more')
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(
+            args.unix, args.host, args.port, args.workers,
+            args.max_pending))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+from hashlib import shake_256
+from multiprocessing import Pool
+from os import cpu_count
+from typing import Iterable, List, Tuple, Union
+
+import RSA_calculations as rsacalc
+
+# Number of signatures each worker process verifies at a time.
+BATCH_CHUNK_SIZE = 1024
+
+
+def hash_message(n: int, message: Union[str, bytes]) -> int:
+    """Hash a message to a number less than n, using as many bytes of
+    SHAKE256 output as fit in a block for n (a full domain hash).
+    """
+    if isinstance(message, str):
+        message = message.encode('utf-8')
+    width = rsacalc.Block_Size(n)
+    if width < 1:
+        raise ValueError('n is too small to sign with')
+    return int.from_bytes(shake_256(message).digest(width), 'big')
+
+def sign(
+        n: int, d: int, message: Union[str, bytes],
+        key: rsacalc.PrivateKey = None) -> int:
+    """Sign a message with private key (n, d), using the Chinese
+    Remainder Theorem if a private key object for n is provided.
+    """
+    h = hash_message(n, message)
+    if h == 0:
+        return 0
+    if key is not None and key.n == n:
+        return rsacalc.CRT_Decode(h, key)
+    return rsacalc.FME(h, d, n)
+
+def verify(
+        n: int, e: int, message: Union[str, bytes], signature: int) -> bool:
+    """Check a signature of a message under public key (n, e)."""
+    if not 0 <= signature < n:
+        return False
+    h = hash_message(n, message)
+    if signature == 0:
+        return h == 0
+    return rsacalc.FME(signature, e, n) == h
+
+def _verify_chunk(task: tuple) -> List[int]:
+    """Verify one chunk of (message, signature) pairs and return the
+    indices of the invalid ones.
+    """
+    n, e, items, offset = task
+    invalid = []
+    for i, (message, signature) in enumerate(items, offset):
+        if not verify(n, e, message, signature):
+            invalid.append(i)
+    return invalid
+
+def verify_batch(
+        n: int, e: int, items: Iterable[Tuple[Union[str, bytes], int]],
+        workers: int = 1) -> List[int]:
+    """Check many (message, signature) pairs under public key (n, e) and
+    return the indices of the invalid ones (an empty list if all are
+    valid).
+    Every signature is checked exactly as verify would. The pairs are
+    split into chunks, which are spread across a pool of worker
+    processes if workers is not 1 (0 means one per CPU).
+    """
+    items = list(items)
+    tasks = []
+    for start in range(0, len(items), BATCH_CHUNK_SIZE):
+        tasks.append(
+            (n, e, items[start:start + BATCH_CHUNK_SIZE], start))
+    if workers <= 0:
+        workers = cpu_count() or 1
+    invalid = []
+    if workers == 1 or len(tasks) == 1:
+        for task in tasks:
+            invalid += _verify_chunk(task)
+        return invalid
+    with Pool(workers) as pool:
+        for chunk_invalid in pool.imap(_verify_chunk, tasks):
+            invalid += chunk_invalid
+    return invalid